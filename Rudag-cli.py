@@ -23,6 +23,8 @@ class RudagCore:
         self.base_url = "http://localhost:5000"
         self.mining_active = False
         self.mining_interval = 9  # 9 segundos entre bloques
+        self.request_timeout = 30  # segundos por petición al nodo
+        self.mining_poll_interval = 2  # segundos entre consultas a /mine/status
 
     def clear_screen(self):
         os.system('clear' if os.name == 'posix' else 'cls')
@@ -62,14 +64,15 @@ class RudagCore:
         print()
         print(f"{self.YELLOW}Selecciona una opción [1-8]: {self.NC}", end="")
 
-    def make_request(self, endpoint, method='GET', data=None):
+    def make_request(self, endpoint, method='GET', data=None, timeout=None):
         """Función auxiliar para hacer requests HTTP"""
+        timeout = timeout or self.request_timeout
         try:
             url = f"{self.base_url}{endpoint}"
             if method.upper() == 'GET':
-                response = requests.get(url)
+                response = requests.get(url, timeout=timeout)
             elif method.upper() == 'POST':
-                response = requests.post(url, json=data)
+                response = requests.post(url, json=data, timeout=timeout)
             
             if response.status_code == 200:
                 return response.json()
@@ -77,6 +80,8 @@ class RudagCore:
                 return {"error": f"HTTP {response.status_code}: {response.text}"}
         except requests.exceptions.ConnectionError:
             return {"error": "No se puede conectar al nodo. ¿Está ejecutándose?"}
+        except requests.exceptions.Timeout:
+            return {"error": f"El nodo no respondió en {timeout} segundos"}
         except Exception as e:
             return {"error": f"Error: {str(e)}"}
 
@@ -334,37 +339,48 @@ class RudagCore:
         print(f"{self.YELLOW}Presiona Ctrl+C en cualquier momento para detener{self.NC}")
         print()
         
-        # Bucle infinito de minería
+        # El nodo mina en segundo plano; aquí solo se consulta su estado
+        result = self.make_request('/mine/start', 'POST')
+        if "error" in result:
+            print(f"{self.RED}Error iniciando la minería: {result['error']}{self.NC}")
+            self.mining_active = False
+        
+        polls = 0
+        last_status = {}
         while self.mining_active:
-            block_count += 1
-            print(f"{self.BLUE}⛏️  Minando bloque #{block_count}...{self.NC}")
-            
-            # Minar bloque
-            result = self.make_request('/mine')
-            
-            # Verificar si la minería fue exitosa
-            if "error" in str(result).lower():
-                print(f"{self.RED}Error en la minería: {result}{self.NC}")
-                print(f"{self.YELLOW}Reintentando en 5 segundos...{self.NC}")
-                time.sleep(5)
-            else:
-                print(f"{self.GREEN}✅ Bloque #{block_count} minado exitosamente{self.NC}")
-                print(f"{self.CYAN}Respuesta: {result}{self.NC}")
-                print()
-                
-                # Espera silenciosa de 9 segundos sin mostrar nada
-                for i in range(9):
-                    if not self.mining_active:
-                        break
-                    time.sleep(1)
+            status = self.make_request('/mine/status')
+            polls += 1
             
-            # Verificar si el nodo sigue respondiendo cada 10 bloques
-            if block_count % 10 == 0 and self.mining_active:
-                print(f"{self.BLUE}Verificando estado del nodo...{self.NC}")
+            if "error" in status:
+                print(f"{self.RED}Error consultando la minería: {status}{self.NC}")
+                # Verificar si el nodo sigue respondiendo
                 test_result = self.make_request('/network')
                 if "error" in test_result:
                     print(f"{self.RED}Error: El nodo ha dejado de responder{self.NC}")
                     self.mining_active = False
+                    break
+            else:
+                if status['blocks_found'] > block_count:
+                    block_count = status['blocks_found']
+                    print(f"{self.GREEN}✅ Bloque #{block_count} minado exitosamente{self.NC}")
+                    print(f"{self.CYAN}Último bloque: {status['last_block']}{self.NC}")
+                    print()
+                
+                if not status['running']:
+                    print(f"{self.RED}La minería se detuvo en el nodo: {status.get('last_error')}{self.NC}")
+                    self.mining_active = False
+                    break
+                
+                last_status = status
+                if polls % 15 == 0:
+                    hashrate = status['hashrate'] or 0
+                    print(f"{self.BLUE}⛏️  Minando bloque {status['current_height']} | "
+                          f"{status['nonces_tried']} nonces | {hashrate:.0f} H/s{self.NC}")
+            
+            time.sleep(self.mining_poll_interval)
+        
+        if last_status.get('running'):
+            self.make_request('/mine/stop', 'POST')
         
         # Limpieza después de detener
         print(f"{self.YELLOW}══════════════════════════════════════════════{self.NC}")
@@ -395,7 +411,7 @@ class RudagCore:
                 self.start_infinite_mining()
             elif choice == "2":
                 print(f"{self.BLUE}Minando bloque único...{self.NC}")
-                result = self.make_request('/mine')
+                result = self.make_request('/mine', timeout=3600)
                 print(f"\n{self.GREEN}Minería completada: {result}{self.NC}")
                 time.sleep(2)
             elif choice == "3":
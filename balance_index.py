@@ -0,0 +1,169 @@
+import os
+import json
+from collections import deque
+from threading import RLock
+
+# Bloques recientes cuyo estado anterior se guarda para deshacerlos en un reorg
+MAX_UNDO_BLOCKS = 100
+
+
+def block_balance_changes(block):
+    """Cambios de balance de un bloque, transacción a transacción y en orden.
+
+    Misma regla que el recorrido clásico de la cadena: quien figura como
+    `destino` o `recibe` suma monto + recompensa y `envia` resta el monto.
+    """
+    for tx in block.get('transacciones', []):
+        for address in {tx.get('destino'), tx.get('recibe')}:
+            if address is not None:
+                yield address, tx.get('monto', 0) + tx.get('recompensa', 0)
+        if tx.get('envia') is not None:
+            yield tx['envia'], -tx.get('monto', 0)
+
+
+class BalanceIndex:
+    """Índice dirección -> balance mantenido al añadir y quitar bloques.
+
+    Cada bloque aplicado guarda el balance anterior de las direcciones que
+    toca (undo), así que un reorg restaura los valores exactos en lugar de
+    restar floats. Si el reorg es más profundo que el undo disponible se
+    reconstruye desde la cadena.
+
+    El índice se persiste como checkpoint (altura + hash de la punta) cada
+    `checkpoint_every` bloques; al arrancar solo se aplican los bloques
+    posteriores al checkpoint. Expone dirty/flush/on_dirty para que el
+    PersistenceScheduler haga la escritura fuera del camino de los bloques.
+    """
+
+    def __init__(self, path, lock=None, checkpoint_every=100):
+        self.path = path
+        self.lock = lock or RLock()
+        self.checkpoint_every = checkpoint_every
+        self.balances = {}
+        self.height = 0  # bloques aplicados
+        self.tip_hash = None
+        self.bytes_written = 0
+        self._undo = deque(maxlen=MAX_UNDO_BLOCKS)  # un dict por bloque reciente
+        self._since_checkpoint = 0
+        self._checkpoint_requested = False
+        # Lo asigna el PersistenceScheduler para enterarse de los cambios
+        self.on_dirty = None
+
+    @property
+    def dirty(self):
+        return self._checkpoint_requested or self._since_checkpoint >= self.checkpoint_every
+
+    def get(self, address):
+        """Balance actual de una dirección"""
+        return self.balances.get(address, 0)
+
+    def load(self, chain, block_hash):
+        """Cargar el checkpoint y aplicar los bloques que falten hasta la punta.
+
+        `block_hash(altura)` da el hash guardado de un bloque; si el del
+        checkpoint ya no está en la cadena (reorg tras el checkpoint), se
+        reconstruye desde el génesis.
+        """
+        with self.lock:
+            self.reset()
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r') as f:
+                        data = json.load(f)
+                    height = data['height']
+                    if height == 0 or (height <= len(chain) and
+                                       block_hash(height - 1) == data['tip_hash']):
+                        self.balances = data['balances']
+                        self.height = height
+                        self.tip_hash = data['tip_hash']
+                        self._undo.extend(data.get('undo', []))
+                    else:
+                        print("⚠️  Checkpoint de balances fuera de la cadena, reconstruyendo")
+                except (ValueError, KeyError) as e:
+                    print(f"⚠️  Checkpoint de balances ilegible ({e}), reconstruyendo")
+
+            missing = len(chain) - self.height
+            if missing > 0:
+                print(f"🔄 Aplicando {missing} bloques al índice de balances")
+                for height in range(self.height, len(chain)):
+                    self.apply_block(chain[height], block_hash(height))
+
+    def reset(self):
+        with self.lock:
+            self.balances = {}
+            self.height = 0
+            self.tip_hash = None
+            self._undo.clear()
+            self._since_checkpoint = 0
+
+    def apply_block(self, block, block_hash):
+        """Sumar al índice los movimientos del bloque siguiente a la punta"""
+        with self.lock:
+            undo = {}
+            for address, delta in block_balance_changes(block):
+                if address not in undo:
+                    undo[address] = self.balances.get(address)
+                self.balances[address] = self.balances.get(address, 0) + delta
+
+            self._undo.append(undo)
+            self.height += 1
+            self.tip_hash = block_hash
+            self._since_checkpoint += 1
+        if self.dirty and self.on_dirty:
+            self.on_dirty()
+
+    def rollback_to(self, height, chain, block_hash):
+        """Deshacer los bloques desde `height`; reconstruye si no hay undo suficiente"""
+        with self.lock:
+            if height >= self.height:
+                return
+            if self.height - height > len(self._undo):
+                print(f"🔄 Reorg más profundo que el undo ({len(self._undo)} bloques), "
+                      f"reconstruyendo balances")
+                self.reset()
+                for h in range(height):
+                    self.apply_block(chain[h], block_hash(h))
+                return
+
+            while self.height > height:
+                for address, previous in self._undo.pop().items():
+                    if previous is None:
+                        self.balances.pop(address, None)
+                    else:
+                        self.balances[address] = previous
+                self.height -= 1
+            self.tip_hash = block_hash(height - 1) if height else None
+            # El checkpoint en disco puede apuntar a bloques que ya no están
+            self._checkpoint_requested = True
+        if self.on_dirty:
+            self.on_dirty()
+
+    def request_checkpoint(self):
+        """Pedir que el próximo flush() escriba el checkpoint aunque no toque"""
+        with self.lock:
+            self._checkpoint_requested = True
+        if self.on_dirty:
+            self.on_dirty()
+
+    def flush(self):
+        """Escribir el checkpoint de forma atómica; devuelve los bytes escritos"""
+        with self.lock:
+            if not self.dirty:
+                return 0
+            data = json.dumps({
+                'height': self.height,
+                'tip_hash': self.tip_hash,
+                'balances': self.balances,
+                'undo': list(self._undo)
+            }, separators=(',', ':'))
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+            self._since_checkpoint = 0
+            self._checkpoint_requested = False
+            self.bytes_written += len(data)
+            return len(data)
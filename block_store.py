@@ -0,0 +1,536 @@
+import os
+import mmap
+import struct
+import zlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from threading import RLock
+
+from codec import encode_block, decode_block, decode_block_header
+
+# Cabecera de cada registro de un segmento: longitud del contenido + CRC32
+RECORD_HEADER = struct.Struct('<II')
+# Entrada del índice (una por altura): segmento, offset y longitud del registro
+INDEX_ENTRY = struct.Struct('<IQI')
+# Hash de cada bloque en `hashes.dat`, en binario y por altura
+HASH_SIZE = 32
+# Segmentos mapeados a la vez (cada mmap mantiene un descriptor abierto)
+MAX_MAPPED_SEGMENTS = 32
+# Tabla hash -> altura en `hashtable.dat`: cabecera (capacidad, alturas
+# indexadas, huecos ocupados) y huecos (etiqueta del hash, altura + 1; 0 = libre)
+TABLE_HEADER = struct.Struct('<QQQ')
+TABLE_SLOT = struct.Struct('<II')
+MIN_TABLE_SLOTS = 4096
+
+
+class BlockStore:
+    """Almacén de bloques append-only en ficheros de segmento rotativos.
+
+    Cada bloque se escribe como un registro [longitud][crc32][contenido] al
+    final del segmento actual; cuando el segmento supera `segment_size` se
+    abre uno nuevo. El índice `index.dat` guarda, por altura, dónde está cada
+    registro. Añadir un bloque cuesta lo que ocupa ese bloque, no la cadena.
+
+    La lectura va por mmap: el índice y los segmentos se mapean en memoria y
+    un bloque se localiza en O(1) por su altura y se decodifica solo cuando se
+    pide. Las páginas mapeadas las gestiona el sistema operativo, así que la
+    memoria residente no crece con la cadena; solo se guardan decodificados
+    los `cache_size` bloques leídos más recientemente.
+
+    El hash de cada bloque se calcula una sola vez al añadirlo (con
+    `hash_function`) y se guarda en `hashes.dat`, paralelo al índice. Para
+    buscar por hash, `hashtable.dat` es una tabla de direccionamiento
+    abierto mapeada en memoria cuyos huecos apuntan a una altura; cada
+    acierto se confirma contra `hashes.dat`, así que los huecos de bloques
+    quitados en un reorg simplemente no coinciden. Se rehace con el doble
+    de capacidad cuando se llena a la mitad.
+
+    Al abrir el almacén se recupera la cola tras una caída: se descartan
+    entradas del índice que apuntan a registros incompletos o corruptos, se
+    reindexan registros completos que no llegaron al índice y se trunca
+    cualquier registro a medio escribir.
+    """
+
+    def __init__(self, directory, hash_function, segment_size=16 * 1024 * 1024, cache_size=256):
+        self.directory = directory
+        self.hash_function = hash_function
+        self.segment_size = segment_size
+        self.cache_size = cache_size
+        self.count = 0  # bloques en el índice
+        # Cambia en cada truncate(): un bloque leído antes ya no es el de su altura
+        self.generation = 0
+        self.bytes_written = 0
+        self._lock = RLock()
+        self._index_map = None
+        self._hashes_map = None
+        self._table_map = None
+        self._table_capacity = 0
+        self._table_covered = 0  # alturas [0, covered) ya en la tabla
+        self._table_used = 0  # huecos ocupados, incluidos los de bloques quitados
+        self._segment_maps = OrderedDict()  # segmento -> mmap (LRU)
+        self._cache = OrderedDict()  # altura -> bloque decodificado (LRU)
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self._open()
+
+    def __len__(self):
+        return self.count
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"blk{segment:05d}.dat")
+
+    def _index_path(self):
+        return os.path.join(self.directory, "index.dat")
+
+    def _hashes_path(self):
+        return os.path.join(self.directory, "hashes.dat")
+
+    def _table_path(self):
+        return os.path.join(self.directory, "hashtable.dat")
+
+    def _encode(self, block):
+        return encode_block(block)
+
+    def _decode(self, payload):
+        return decode_block(payload)
+
+    def _map(self, path, size):
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def _entry(self, height):
+        """Entrada (segmento, offset, longitud) de una altura, leída del índice mapeado"""
+        end = (height + 1) * INDEX_ENTRY.size
+        if self._index_map is None or len(self._index_map) < end:
+            # El índice creció desde el último mapeo
+            if self._index_map is not None:
+                self._index_map.close()
+            self._index_map = self._map(self._index_path(), self.count * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack_from(self._index_map, height * INDEX_ENTRY.size)
+
+    def _hash_at(self, height):
+        """Hash binario de una altura, leído de hashes.dat mapeado"""
+        end = (height + 1) * HASH_SIZE
+        if self._hashes_map is None or len(self._hashes_map) < end:
+            if self._hashes_map is not None:
+                self._hashes_map.close()
+            self._hashes_map = self._map(self._hashes_path(), self.count * HASH_SIZE)
+        return self._hashes_map[height * HASH_SIZE:end]
+
+    def _segment_map(self, segment, end):
+        """mmap de un segmento que cubra al menos hasta `end`"""
+        segment_map = self._segment_maps.pop(segment, None)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            segment_map = self._map(self._segment_path(segment), 0)
+            while len(self._segment_maps) >= MAX_MAPPED_SEGMENTS:
+                self._segment_maps.popitem(last=False)[1].close()
+        self._segment_maps[segment] = segment_map
+        return segment_map
+
+    def _unmap(self, from_segment=0):
+        """Cerrar los mapeos afectados antes de truncar ficheros"""
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        if self._hashes_map is not None:
+            self._hashes_map.close()
+            self._hashes_map = None
+        for segment in [s for s in self._segment_maps if s >= from_segment]:
+            self._segment_maps.pop(segment).close()
+
+    def _tail(self):
+        """Segmento y offset donde empieza el siguiente registro"""
+        if not self.count:
+            return 0, 0
+        segment, offset, length = self._entry(self.count - 1)
+        return segment, offset + length
+
+    def _open(self):
+        """Validar la cola del índice y recuperar registros tras un posible corte"""
+        if os.path.exists(self._index_path()):
+            size = os.path.getsize(self._index_path())
+            self.count = size // INDEX_ENTRY.size
+            dirty = size % INDEX_ENTRY.size != 0
+        else:
+            self.count = 0
+            dirty = True
+
+        # El índice puede ir por delante de los segmentos si se cortó la escritura
+        while self.count and not self._record_ok(*self._entry(self.count - 1)):
+            self.count -= 1
+            dirty = True
+
+        if dirty:
+            self._unmap()
+            with open(self._index_path(), 'ab') as f:
+                f.truncate(self.count * INDEX_ENTRY.size)
+                f.flush()
+                os.fsync(f.fileno())
+
+        recovered = self._recover_tail()
+        if recovered:
+            self._write_index(recovered)
+        self._open_hashes()
+
+    def _open_hashes(self):
+        """Ajustar hashes.dat al índice (recalculando lo que falte) y abrir la tabla hash -> altura"""
+        size = os.path.getsize(self._hashes_path()) if os.path.exists(self._hashes_path()) else 0
+        known = min(size // HASH_SIZE, self.count)
+        with open(self._hashes_path(), 'ab') as f:
+            if size != known * HASH_SIZE:
+                f.truncate(known * HASH_SIZE)
+            if known < self.count:
+                print(f"🔄 Calculando hashes de {self.count - known} bloques en {self.directory}")
+                for height in range(known, self.count):
+                    f.write(bytes.fromhex(self.hash_function(self.read(height, cache=False))))
+            f.flush()
+            os.fsync(f.fileno())
+        self._open_table()
+
+    def _open_table(self):
+        """Mapear hashtable.dat e indexar las alturas que no llegaron a la tabla"""
+        path = self._table_path()
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        capacity = covered = used = 0
+        if size >= TABLE_HEADER.size:
+            with open(path, 'rb') as f:
+                capacity, covered, used = TABLE_HEADER.unpack(f.read(TABLE_HEADER.size))
+        if not capacity or size != TABLE_HEADER.size + capacity * TABLE_SLOT.size:
+            self._rebuild_table()
+            return
+
+        self._table_map = self._map_table(path)
+        self._table_capacity = capacity
+        self._table_used = used
+        # Lo que quede por encima de la cadena son huecos de bloques quitados
+        self._table_covered = min(covered, self.count)
+        self._index_heights(self._table_covered)
+
+    def _map_table(self, path):
+        with open(path, 'r+b') as f:
+            return mmap.mmap(f.fileno(), 0)
+
+    def _rebuild_table(self):
+        """Reescribir la tabla con las alturas actuales y capacidad para crecer"""
+        if self._table_map is not None:
+            self._table_map.close()
+        capacity = max(MIN_TABLE_SLOTS, 4 * self.count)
+        path = self._table_path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.truncate(TABLE_HEADER.size + capacity * TABLE_SLOT.size)
+
+        self._table_map = self._map_table(tmp_path)
+        self._table_capacity = capacity
+        self._table_used = 0
+        for height in range(self.count):
+            self._table_insert(self._hash_at(height), height)
+        self._table_covered = self.count
+        self._write_table_header()
+        self._table_map.close()
+        os.replace(tmp_path, path)
+        self._table_map = self._map_table(path)
+
+    def _write_table_header(self):
+        # Primero los huecos y después la cabecera que los da por indexados
+        self._table_map.flush()
+        TABLE_HEADER.pack_into(self._table_map, 0, self._table_capacity,
+                               self._table_covered, self._table_used)
+        self._table_map.flush()
+
+    def _table_slot(self, digest):
+        """Hueco inicial y etiqueta de un hash en la tabla"""
+        return (int.from_bytes(digest[:8], 'little') % self._table_capacity,
+                int.from_bytes(digest[8:12], 'little'))
+
+    def _table_insert(self, digest, height):
+        slot, tag = self._table_slot(digest)
+        while TABLE_SLOT.unpack_from(self._table_map, TABLE_HEADER.size + slot * TABLE_SLOT.size)[1]:
+            slot = (slot + 1) % self._table_capacity
+        TABLE_SLOT.pack_into(self._table_map, TABLE_HEADER.size + slot * TABLE_SLOT.size, tag, height + 1)
+        self._table_used += 1
+
+    def _index_heights(self, start):
+        """Añadir a la tabla las alturas [start, count)"""
+        if start >= self.count:
+            return
+        if 2 * (self._table_used + self.count - start) > self._table_capacity:
+            self._rebuild_table()
+            return
+        for height in range(start, self.count):
+            self._table_insert(self._hash_at(height), height)
+        self._table_covered = self.count
+        self._write_table_header()
+
+    def _record_ok(self, segment, offset, length):
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                record = f.read(length)
+        except OSError:
+            return False
+        if len(record) != length or length < RECORD_HEADER.size:
+            return False
+        size, crc = RECORD_HEADER.unpack_from(record)
+        payload = record[RECORD_HEADER.size:]
+        return size == len(payload) and zlib.crc32(payload) == crc
+
+    def _recover_tail(self):
+        """Entradas de los registros completos tras la última del índice; trunca el resto"""
+        segment, offset = self._tail()
+        recovered = []
+
+        while os.path.exists(self._segment_path(segment)):
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+
+            pos = 0
+            while pos + RECORD_HEADER.size <= len(data):
+                size, crc = RECORD_HEADER.unpack_from(data, pos)
+                start = pos + RECORD_HEADER.size
+                payload = data[start:start + size]
+                if len(payload) != size or zlib.crc32(payload) != crc:
+                    break
+                recovered.append((segment, offset + pos, RECORD_HEADER.size + size))
+                pos = start + size
+
+            if pos < len(data):
+                # Registro a medio escribir: se trunca y se descarta lo posterior
+                print(f"⚠️  Cola corrupta en {self._segment_path(segment)}, truncando")
+                with open(self._segment_path(segment), 'r+b') as f:
+                    f.truncate(offset + pos)
+                self._remove_segments_after(segment)
+                break
+
+            segment, offset = segment + 1, 0
+
+        return recovered
+
+    def _remove_segments_after(self, segment):
+        segment += 1
+        while os.path.exists(self._segment_path(segment)):
+            os.remove(self._segment_path(segment))
+            segment += 1
+
+    def _write_index(self, entries):
+        index_data = b''.join(INDEX_ENTRY.pack(*entry) for entry in entries)
+        with open(self._index_path(), 'ab') as f:
+            f.write(index_data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.count += len(entries)
+        return len(index_data)
+
+    def _write_hashes(self, digests):
+        data = b''.join(digests)
+        with open(self._hashes_path(), 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(data)
+
+    def append(self, block, block_hash=None):
+        """Añadir un bloque al final; devuelve su altura"""
+        return self.append_many([block], None if block_hash is None else [block_hash])
+
+    def append_many(self, blocks, hashes=None):
+        """Añadir varios bloques con un único fsync; devuelve la última altura.
+
+        `hashes` son los hashes de los bloques si el llamador ya los calculó.
+        """
+        if hashes is None:
+            hashes = [self.hash_function(block) for block in blocks]
+        digests = [bytes.fromhex(block_hash) for block_hash in hashes]
+
+        with self._lock:
+            segment, offset = self._tail()
+            entries = []
+
+            f = open(self._segment_path(segment), 'ab')
+            try:
+                for block in blocks:
+                    payload = self._encode(block)
+                    record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+                    # Rotar de segmento si este ya está lleno
+                    if offset > 0 and offset + len(record) > self.segment_size:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        f.close()
+                        segment, offset = segment + 1, 0
+                        f = open(self._segment_path(segment), 'ab')
+
+                    f.write(record)
+                    entries.append((segment, offset, len(record)))
+                    offset += len(record)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+
+            # Hashes e índice van después de los datos: si se corta aquí, se reconstruyen
+            hash_bytes = self._write_hashes(digests)
+            index_bytes = self._write_index(entries)
+            self._index_heights(self._table_covered)
+            self.bytes_written += sum(entry[2] for entry in entries) + hash_bytes + index_bytes
+            return self.count - 1
+
+    def block_hash(self, height):
+        """Hash (hex) del bloque de una altura, sin leer ni rehashear el bloque"""
+        with self._lock:
+            if not 0 <= height < self.count:
+                raise IndexError(f"Altura fuera de rango: {height}")
+            return self._hash_at(height).hex()
+
+    def height_of(self, block_hash):
+        """Altura del bloque con ese hash, o None si no está en la cadena"""
+        try:
+            digest = bytes.fromhex(block_hash)
+        except (TypeError, ValueError):
+            return None
+        if len(digest) != HASH_SIZE:
+            return None
+
+        with self._lock:
+            slot, tag = self._table_slot(digest)
+            while True:
+                entry_tag, entry = TABLE_SLOT.unpack_from(
+                    self._table_map, TABLE_HEADER.size + slot * TABLE_SLOT.size)
+                if not entry:
+                    return None
+                # Confirmar contra hashes.dat: el hueco puede ser de un bloque quitado
+                height = entry - 1
+                if entry_tag == tag and height < self.count and self._hash_at(height) == digest:
+                    return height
+                slot = (slot + 1) % self._table_capacity
+
+    def read_payload(self, height):
+        """Bytes codificados del bloque de una altura, sin decodificar"""
+        with self._lock:
+            if not 0 <= height < self.count:
+                raise IndexError(f"Altura fuera de rango: {height}")
+            segment, offset, length = self._entry(height)
+            segment_map = self._segment_map(segment, offset + length)
+            return segment_map[offset + RECORD_HEADER.size:offset + length]
+
+    def read(self, height, cache=True):
+        """Leer el bloque de una altura (O(1): índice y segmento mapeados)"""
+        with self._lock:
+            block = self._cache.get(height)
+            if block is not None:
+                self._cache.move_to_end(height)
+                return block
+            payload = self.read_payload(height)
+            generation = self.generation
+
+        block = self._decode(payload)
+        if cache:
+            with self._lock:
+                # Si un reorg cambió la altura mientras se decodificaba, no se cachea
+                if generation == self.generation and height < self.count:
+                    self._cache[height] = block
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return block
+
+    def read_header(self, height):
+        """Cabecera del bloque de una altura: sus campos fijos y `n_tx`.
+
+        Se leen del registro mapeado sin decodificar las transacciones ni
+        pasar por la caché; los bloques en formato genérico se decodifican
+        enteros.
+        """
+        with self._lock:
+            block = self._cache.get(height)
+            if block is None:
+                if not 0 <= height < self.count:
+                    raise IndexError(f"Altura fuera de rango: {height}")
+                segment, offset, length = self._entry(height)
+                segment_map = self._segment_map(segment, offset + length)
+                header = decode_block_header(segment_map, offset + RECORD_HEADER.size)
+                if header is not None:
+                    return header
+
+        if block is None:
+            block = self.read(height, cache=False)
+        return {
+            'indice': block['indice'],
+            'hash_anterior': block['hash_anterior'],
+            'tiempo': block['tiempo'],
+            'nonce': block['nonce'],
+            'n_tx': len(block['transacciones'])
+        }
+
+    def iter_blocks(self, start=0, stop=None):
+        """Recorrer los bloques de [start, stop) sin llenar la caché"""
+        height = start
+        while height < (self.count if stop is None else min(stop, self.count)):
+            yield self.read(height, cache=False)
+            height += 1
+
+    def truncate(self, height):
+        """Eliminar los bloques desde `height` en adelante (reorganizaciones)"""
+        with self._lock:
+            if height >= self.count:
+                return
+
+            self.count = height
+            self.generation += 1
+            # Los huecos de las alturas quitadas quedan y se descartan al buscar
+            self._table_covered = min(self._table_covered, height)
+            self._write_table_header()
+            segment, offset = self._tail()
+            self._unmap(segment)
+            for cached in [h for h in self._cache if h >= height]:
+                del self._cache[cached]
+
+            if os.path.exists(self._segment_path(segment)):
+                with open(self._segment_path(segment), 'r+b') as f:
+                    f.truncate(offset)
+            self._remove_segments_after(segment)
+
+            with open(self._index_path(), 'r+b') as f:
+                f.truncate(self.count * INDEX_ENTRY.size)
+            with open(self._hashes_path(), 'r+b') as f:
+                f.truncate(self.count * HASH_SIZE)
+
+    def close(self):
+        with self._lock:
+            self._unmap()
+            if self._table_map is not None:
+                self._table_map.close()
+                self._table_map = None
+
+
+class ChainView(Sequence):
+    """Vista de solo lectura de la cadena sobre un BlockStore.
+
+    Se comporta como la lista de bloques de siempre (len, índices negativos,
+    slices, iteración) pero cada bloque se lee del almacén al accederlo. Los
+    cambios de la cadena se hacen en el almacén y la vista los refleja.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return list(self.store.iter_blocks(start, stop))
+            return [self.store.read(height) for height in range(start, stop, step)]
+
+        height = key + len(self) if key < 0 else key
+        if not 0 <= height < len(self):
+            raise IndexError("Índice de bloque fuera de rango")
+        return self.store.read(height)
+
+    def __iter__(self):
+        return self.store.iter_blocks()
@@ -1,8 +1,10 @@
 from core import hash_bloque, Bloque, Blockchain, create_rgd_address, RGDBlockchainConfig
 from wallet_manager import WalletManager
-from network_manager import NetworkManager
+from network_manager import NetworkManager, GOSSIP_PROTOCOL
+from miner import ParallelMiner, MiningJob
 from time import time
-from fastapi import FastAPI, Request
+from codec import MEDIA_TYPE, encode_blocks
+from fastapi import FastAPI, Query, Request, Response
 from pydantic import BaseModel
 import uvicorn
 
@@ -24,6 +26,8 @@ app = FastAPI()
 wallet_manager = WalletManager()
 blockchain = Blockchain(node_id=create_rgd_address())
 network_manager = NetworkManager(blockchain, wallet_manager)
+miner = ParallelMiner(blockchain)
+mining_job = MiningJob(blockchain, network_manager, miner)
 
 # Variable para almacenar la wallet del nodo minero
 mining_wallet = None
@@ -60,7 +64,9 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Detener servicios cuando se apaga la aplicación"""
+    mining_job.stop()
     network_manager.stop_network_services()
+    blockchain.close()
     print("🛑 Servicios de red detenidos")
 
 @app.get('/')
@@ -84,43 +90,106 @@ def network_info():
     return blockchain.get_network_info()
 
 @app.get('/chain')
-def full_chain():
+def full_chain(request: Request, start: int = Query(0, alias='from', ge=0), count: int = Query(None, ge=1)):
+    # Paginación: ?from=H&count=N lee solo esos bloques del almacén
+    largo = len(blockchain.chain)
+    end = largo if count is None else min(start + count, largo)
+    blocks = blockchain.chain[start:end]
+    
+    # Transferencia entre nodos: codificación binaria compacta si se pide
+    if MEDIA_TYPE in request.headers.get('accept', ''):
+        return Response(content=encode_blocks(blocks), media_type=MEDIA_TYPE)
+    
     resp = {
-        'chain': blockchain.chain,
-        'largo': len(blockchain.chain),
+        'chain': blocks,
+        'largo': largo,
+        'desde': start,
         'total_supply': blockchain.get_total_supply(),
         'current_reward': blockchain.get_current_reward(),
-        'pending_transactions': len(blockchain.transacciones_pendientes),
+        'pending_transactions': len(blockchain.mempool),
         'genesis_address': RGDBlockchainConfig.GENESIS_ADDRESS
     }
     return resp
 
+@app.get('/block/{height}')
+def get_block(height: int):
+    """Bloque de una altura (índices negativos cuentan desde la punta)"""
+    with blockchain.lock:
+        largo = len(blockchain.chain)
+        if height < 0:
+            height += largo
+        if not 0 <= height < largo:
+            return {'error': f'No existe el bloque {height}', 'largo': largo}
+        return {
+            'altura': height,
+            'hash': blockchain.block_hash(height),
+            'bloque': blockchain.chain[height]
+        }
+
+@app.get('/supply/{height}')
+def supply_at(height: int):
+    """Supply y fees acumulados hasta una altura"""
+    try:
+        return blockchain.get_supply_at(height)
+    except IndexError:
+        return {'error': f'No existe el bloque {height}', 'largo': len(blockchain.chain)}
+
+@app.get('/block/hash/{block_hash}')
+def get_block_by_hash(block_hash: str):
+    """Bloque con ese hash, si está en la cadena principal"""
+    found = blockchain.get_block_by_hash(block_hash)
+    if found is None:
+        return {'error': f'No existe un bloque con hash {block_hash}'}
+    height, block = found
+    return {'altura': height, 'hash': block_hash, 'bloque': block}
+
+@app.get('/tx/{tx_hash}')
+def get_transaction(tx_hash: str):
+    """Transacción por su hash: bloque y posición si está confirmada, o pendiente"""
+    found = blockchain.get_transaction(tx_hash)
+    if found is None:
+        return {'error': f'No existe una transacción con hash {tx_hash}'}
+    return found
+
+@app.get('/headers')
+def get_headers(start: int = Query(0, alias='from', ge=0), count: int = Query(RGDBlockchainConfig.SYNC_HEADERS_BATCH, ge=1),
+                locator: str = None):
+    """Cabeceras de bloques para la sincronización headers-first.
+
+    Con `locator` (hashes separados por comas, de Blockchain.block_locator)
+    se empieza tras el último bloque común en lugar de en `from`.
+    """
+    count = min(count, RGDBlockchainConfig.SYNC_HEADERS_BATCH)
+    if locator:
+        start = blockchain.locate_fork(locator.split(','))
+    return {
+        'largo': len(blockchain.chain),
+        'desde': start,
+        'headers': blockchain.get_headers(start, count)
+    }
+
+@app.get('/blocks')
+def get_blocks(request: Request, start: int = Query(0, alias='from', ge=0), count: int = Query(RGDBlockchainConfig.SYNC_BLOCKS_BATCH, ge=1)):
+    """Bloques completos [from, from + count) para la sincronización"""
+    count = min(count, RGDBlockchainConfig.SYNC_BLOCKS_BATCH)
+    blocks = blockchain.chain[start:start + count]
+    if MEDIA_TYPE in request.headers.get('accept', ''):
+        return Response(content=encode_blocks(blocks), media_type=MEDIA_TYPE)
+    return {
+        'largo': len(blockchain.chain),
+        'desde': start,
+        'blocks': blocks
+    }
+
 @app.get('/mine')
 def minar_bloque():
     if not mining_wallet:
         return {'error': 'No hay wallet configurada para minar. Use /set_mining_wallet primero.'}
+    if mining_job.running:
+        return {'error': 'Hay un minado en segundo plano activo. Consulte /mine/status o use /mine/stop.'}
     
-    # Recompensa actual + fees de transacciones
-    current_reward = blockchain.get_current_reward()
-    total_fees = sum(tx.get('fee', 0) for tx in blockchain.transacciones_pendientes)
-    
-    # Crear transacción coinbase
-    coinbase_tx = {
-        'tipo': 'coinbase',
-        'recompensa': current_reward,
-        'fees': total_fees,
-        'destino': mining_wallet,
-        'timestamp': time()
-    }
-    
-    # Transacciones del bloque: coinbase + pendientes
-    block_transactions = [coinbase_tx] + blockchain.transacciones_pendientes
-    
-    hash_bloque_anterior = hash_bloque(blockchain.last_block) if blockchain.last_block else "0" * 64
-    index = len(blockchain.chain)
-    
-    block = blockchain.proof_of_work(index, hash_bloque_anterior, block_transactions, time())
-    blockchain.nuevo_bloque(block)
+    # Coinbase (recompensa actual + fees) + pendientes; reinicia si cambia la punta
+    block, template = mining_job.mine_block(mining_wallet)
     
     # Transmitir nuevo bloque a la red
     network_manager.broadcast_new_block(block.__dict__)
@@ -130,22 +199,58 @@ def minar_bloque():
         'index': block.indice,
         'hash_anterior': block.hash_anterior,
         'nonce': block.nonce,
-        'recompensa': current_reward,
-        'fees': total_fees,
+        'recompensa': template['recompensa'],
+        'fees': template['fees'],
         'transacciones': len(block.transacciones),
         'total_supply': blockchain.get_total_supply(),
         'mining_wallet': mining_wallet,
+        'hashrate': miner.ultimo_hashrate,
+        'mining_workers': miner.workers,
         'transmitted': True
     }
     return resp
 
+@app.post('/mine/start')
+async def start_mining():
+    """Iniciar minado continuo en segundo plano"""
+    if not mining_wallet:
+        return {'error': 'No hay wallet configurada para minar. Use /set_mining_wallet primero.'}
+    
+    if not mining_job.start(mining_wallet):
+        return {'error': 'El minado en segundo plano ya está activo'}
+    
+    return {
+        'mensaje': 'Minado en segundo plano iniciado',
+        'mining_wallet': mining_wallet,
+        'mining_workers': miner.workers
+    }
+
+@app.get('/mine/status')
+def mining_status():
+    """Estado del minado en segundo plano"""
+    return mining_job.status()
+
+@app.post('/mine/stop')
+def stop_mining():
+    """Detener el minado en segundo plano"""
+    if not mining_job.stop():
+        return {'error': 'No hay minado en segundo plano activo'}
+    
+    return {
+        'mensaje': 'Minado en segundo plano detenido',
+        'bloques_minados': mining_job.blocks_found
+    }
+
 @app.post('/transaciones/new')
 async def new_transaction(item: Transaccion):
+    # Mismo timestamp en la mempool local y en la red: mismo id de transacción
+    timestamp = time()
     index = blockchain.add_transaction(
         monto=item.monto,
         recibe=item.recibe,
         envia=item.envia,
-        fee=item.fee
+        fee=item.fee,
+        timestamp=timestamp
     )
     
     # Transmitir transacción a la red
@@ -154,7 +259,7 @@ async def new_transaction(item: Transaccion):
         'recibe': item.recibe,
         'monto': item.monto,
         'fee': item.fee,
-        'timestamp': time()
+        'timestamp': timestamp
     }
     network_manager.broadcast_new_transaction(transaction_data)
     
@@ -326,10 +431,13 @@ async def receive_network_message(request: Request):
     """Endpoint para recibir mensajes de la red"""
     try:
         message = await request.json()
-        network_manager.receive_message(message)
-        return {'status': 'message_received'}
+        reply = network_manager.receive_message(message)
+        # node_id permite al emisor asociar nuestros mensajes a su peer y
+        # protocol le dice que entendemos inv/getdata y lotes
+        return {'status': 'message_received', 'node_id': blockchain.node_id,
+                'protocol': GOSSIP_PROTOCOL, **(reply or {})}
     except Exception as e:
-        return {'error': f'Error processing message: {e}'}
+        return {'error': f'Error processing message: {e}', 'protocol': GOSSIP_PROTOCOL}
 
 @app.get('/network/status')
 def network_status():
@@ -338,11 +446,28 @@ def network_status():
         'node_id': blockchain.node_id,
         'connected_nodes': list(blockchain.nodes),
         'block_height': len(blockchain.chain),
-        'pending_transactions': len(blockchain.transacciones_pendientes),
+        'pending_transactions': len(blockchain.mempool),
         'network_services': 'active',
         'genesis_address': RGDBlockchainConfig.GENESIS_ADDRESS
     }
 
+@app.get('/metrics')
+def metrics():
+    """Métricas internas del nodo"""
+    return {
+        'persistence': {
+            **blockchain.persistence.stats(),
+            'block_store_bytes_written': blockchain.store.bytes_written
+        },
+        'mining': mining_job.status(),
+        'sync': blockchain.chain_sync.last_round,
+        'peers': blockchain.peer_client.stats(),
+        'broadcast': network_manager.broadcaster.stats(),
+        'inventory': network_manager.inventory.stats(),
+        'seen_messages': network_manager.seen_messages.stats(),
+        'mempool': blockchain.mempool.stats()
+    }
+
 @app.get('/peers')
 def get_peers():
     """Obtener lista de peers conectados"""
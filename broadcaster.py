@@ -0,0 +1,218 @@
+import time
+from collections import deque
+from queue import Queue, Full
+from threading import Thread, Lock
+
+# Últimas entregas y difusiones de las que se calculan percentiles
+LATENCY_SAMPLES = 1000
+
+
+def _percentiles(samples):
+    """p50/p95/máximo en milisegundos de una muestra de latencias en segundos"""
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None, 'max_ms': None}
+    ordered = sorted(samples)
+    return {
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000,
+        'max_ms': ordered[-1] * 1000
+    }
+
+
+class _Fanout:
+    """Seguimiento de un mensaje difundido hasta que todos los peers terminan"""
+
+    def __init__(self, message, peers):
+        self.message = message
+        # Desde que se creó el mensaje, incluida la espera en la cola general
+        self.created = message.get('timestamp', time.time())
+        self.pending = peers
+
+
+class PeerSender:
+    """Cola de envío y trabajador propios de un peer.
+
+    Un peer lento o caído solo retrasa su propia cola; si se llena, los
+    mensajes nuevos para ese peer se descartan y se cuentan. Al pararlo, lo
+    que quede en la cola se da por no entregado.
+    """
+
+    def __init__(self, node, broadcaster, queue_size):
+        self.node = node
+        self.broadcaster = broadcaster
+        self.queue = Queue(maxsize=queue_size)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.last_latency = None
+        self.stopped = False
+        # Ordena las altas en la cola con la parada: tras stop() no entra nada
+        self._lock = Lock()
+        self._thread = Thread(target=self._send_worker, daemon=True,
+                              name=f"broadcast-{node}")
+        self._thread.start()
+
+    def enqueue(self, fanout):
+        """Encolar una difusión; False si no entra (cola llena o peer parado)"""
+        with self._lock:
+            if self.stopped:
+                return False
+            try:
+                self.queue.put_nowait(fanout)
+                return True
+            except Full:
+                self.dropped += 1
+                print(f"⚠️  Cola de envío de {self.node} llena, mensaje descartado")
+                return False
+
+    def stop(self):
+        """Terminar el trabajador tras el envío en curso"""
+        with self._lock:
+            self.stopped = True
+            try:
+                self.queue.put_nowait(None)  # despertarlo si está esperando
+            except Full:
+                pass
+
+    def _drain(self):
+        """Dar por no entregado lo que quedó en la cola al parar"""
+        with self._lock:
+            pending = []
+            while not self.queue.empty():
+                fanout = self.queue.get_nowait()
+                if fanout is not None:
+                    pending.append(fanout)
+        for fanout in pending:
+            self.broadcaster._delivered(fanout, None)
+
+    def _send_worker(self):
+        while True:
+            fanout = self.queue.get()
+            if fanout is None or self.stopped:
+                if fanout is not None:
+                    self.broadcaster._delivered(fanout, None)
+                self._drain()
+                break
+            message = fanout.message
+            if self.broadcaster.prepare:
+                message = self.broadcaster.prepare(self.node, message)
+                if message is None:
+                    # Nada que enviar a este peer (ya lo tiene todo)
+                    self.skipped += 1
+                    self.broadcaster._delivered(fanout, None)
+                    continue
+            ok = False
+            try:
+                response = self.broadcaster.peer_client.post(
+                    self.node,
+                    '/network/receive',
+                    json=message
+                )
+                ok = response.status_code == 200
+                if ok and self.broadcaster.on_response:
+                    self.broadcaster.on_response(self.node, message, response)
+                if ok:
+                    print(f"✅ Mensaje {message['type']} transmitido a {self.node}")
+                else:
+                    print(f"❌ {self.node} rechazó el mensaje {message['type']}: "
+                          f"HTTP {response.status_code}")
+            except Exception as e:
+                ok = False
+                print(f"❌ Error en broadcast a {self.node}: {e}")
+
+            if ok:
+                self.sent += 1
+                self.last_latency = time.time() - fanout.created
+            else:
+                self.failed += 1
+            self.broadcaster._delivered(fanout, self.last_latency if ok else None)
+
+
+class Broadcaster:
+    """Difusión concurrente de mensajes a los peers.
+
+    Cada peer tiene su PeerSender (cola + hilo), así que un mensaje se envía
+    a todos los peers a la vez y un peer lento no retrasa a los demás ni a
+    los mensajes siguientes. Mide la latencia extremo a extremo: de cada
+    entrega (desde que se crea el mensaje hasta que el peer lo acepta) y
+    de cada difusión completa (hasta que han terminado todos los peers).
+
+    Los ganchos opcionales `prepare(nodo, mensaje)` (adapta el mensaje al
+    peer, o devuelve None para no enviarle nada) y `on_response(nodo,
+    mensaje, respuesta)` corren en el hilo de cada peer: lo que tarden solo
+    retrasa a ese peer y cuenta en su latencia de entrega.
+    """
+
+    def __init__(self, peer_client, queue_size=1000, prepare=None, on_response=None):
+        self.peer_client = peer_client
+        self.queue_size = queue_size
+        self.prepare = prepare
+        self.on_response = on_response
+        self._senders = {}
+        self._lock = Lock()
+        self.messages = 0
+        self._delivery_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._fanout_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def broadcast(self, message, nodes):
+        """Encolar el mensaje en la cola de cada peer; no espera a los envíos.
+
+        `nodes` debe ser una copia de la lista de peers que no cambie durante
+        la llamada.
+        """
+        with self._lock:
+            # Parar los trabajadores de los peers que ya no están en la lista
+            for node in set(self._senders) - set(nodes):
+                self._senders.pop(node).stop()
+            senders = []
+            for node in nodes:
+                if node not in self._senders:
+                    self._senders[node] = PeerSender(node, self, self.queue_size)
+                senders.append(self._senders[node])
+            self.messages += 1
+            fanout = _Fanout(message, len(senders))
+
+        for sender in senders:
+            if not sender.enqueue(fanout):
+                self._delivered(fanout, None)
+
+    def _delivered(self, fanout, latency):
+        """Un peer terminó con el mensaje (latency es None si falló o se descartó)"""
+        with self._lock:
+            if latency is not None:
+                self._delivery_latencies.append(latency)
+            fanout.pending -= 1
+            if fanout.pending == 0:
+                self._fanout_latencies.append(time.time() - fanout.created)
+
+    def stop(self):
+        with self._lock:
+            for sender in self._senders.values():
+                sender.stop()
+            self._senders.clear()
+
+    def stats(self):
+        """Latencias de difusión y profundidad de la cola de cada peer"""
+        with self._lock:
+            delivery = list(self._delivery_latencies)
+            fanout = list(self._fanout_latencies)
+            peers = {
+                node: {
+                    'queue_depth': sender.queue.qsize(),
+                    'sent': sender.sent,
+                    'failed': sender.failed,
+                    'dropped': sender.dropped,
+                    'skipped': sender.skipped,
+                    'last_latency_ms': (sender.last_latency * 1000
+                                        if sender.last_latency is not None else None)
+                }
+                for node, sender in self._senders.items()
+            }
+        return {
+            'messages': self.messages,
+            'delivery_latency': _percentiles(delivery),
+            'fanout_latency': _percentiles(fanout),
+            'queue_size': self.queue_size,
+            'peers': peers
+        }
@@ -0,0 +1,243 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+
+from codec import MEDIA_TYPE, decode_blocks, chain_from_response
+
+
+class ChainSync:
+    """Sincronización headers-first con los peers.
+
+    A cada peer se le piden primero cabeceras (/headers) con nuestro block
+    locator: el peer responde desde el último bloque común, así que una sola
+    consulta da el punto de bifurcación y, si el peer no va por delante, no
+    trae ninguna cabecera. De los peers que van por delante se validan las
+    cabeceras (encadenado y alturas). El hash declarado en una cabecera no
+    se puede comprobar sin las transacciones, así que el largo de cada
+    candidato es solo lo que dice el peer: sirve para decidir a quién
+    pedir primero los cuerpos (/blocks), no para adoptar nada. Cada lote
+    de cuerpos debe tener el hash de sus cabeceras y un PoW válido antes
+    de aplicarse; si no, se descarta el candidato y se prueba el siguiente.
+
+    Los peers se consultan en paralelo. La ronda tiene un plazo global
+    (`round_deadline`) y no espera a todos: se elige el mejor candidato en
+    cuanto responden `quorum` peers o, tras la primera respuesta, cuando pasan
+    `answer_grace` segundos más. La latencia la marca el peer bueno más
+    rápido y no la suma de los timeouts de los peers caídos.
+
+    Los nodos sin /headers se sincronizan como antes, con /chain completa.
+    """
+
+    def __init__(self, blockchain, headers_batch=2000, blocks_batch=500, timeout=15,
+                 max_workers=16, round_deadline=20, quorum=3, answer_grace=2):
+        self.blockchain = blockchain
+        self.headers_batch = headers_batch
+        self.blocks_batch = blocks_batch
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.round_deadline = round_deadline
+        self.quorum = quorum
+        self.answer_grace = answer_grace
+        self.last_round = None
+        # Una sola ronda a la vez (sync periódico, /nodo/sync, bloques por delante)
+        self._round_lock = Lock()
+
+    def _get(self, node, path, params=None, binary=False):
+        """GET a un peer por su endpoint recordado (ver PeerClient)"""
+        headers = {'Accept': MEDIA_TYPE} if binary else None
+        return self.blockchain.peer_client.get(node, path, params=params,
+                                               headers=headers, timeout=self.timeout)
+
+    def fetch_headers(self, node, start, count, locator=None):
+        """Respuesta de /headers (largo, desde, headers), o None si el peer no tiene /headers"""
+        params = {'from': start, 'count': count}
+        if locator:
+            params['locator'] = ','.join(locator)
+        response = self._get(node, '/headers', params)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_blocks(self, node, start, count):
+        """Bloques completos [start, start + count) de un peer"""
+        response = self._get(node, '/blocks', {'from': start, 'count': count}, binary=True)
+        response.raise_for_status()
+        if response.headers.get('Content-Type', '').startswith(MEDIA_TYPE):
+            return decode_blocks(response.content)
+        return response.json()['blocks']
+
+    def probe_peer(self, node):
+        """Candidato de sincronización de un peer, o None si no va por delante"""
+        local_length = len(self.blockchain.chain)
+
+        result = self.fetch_headers(node, 0, self.headers_batch, self.blockchain.block_locator())
+        if result is None:
+            return self._probe_legacy(node, local_length)
+        peer_length, fork_height, headers = result['largo'], result['desde'], result['headers']
+        print(f"📡 Nodo {node}: {peer_length} bloques (común hasta {fork_height})")
+        if peer_length <= local_length:
+            return None
+
+        # El locator es aproximado lejos de la punta: saltar las cabeceras comunes
+        while (headers and fork_height < local_length and
+               headers[0]['hash'] == self.blockchain.block_hash(fork_height)):
+            headers = headers[1:]
+            fork_height += 1
+
+        # Completar las cabeceras hasta la punta del peer
+        while fork_height + len(headers) < peer_length:
+            more = self.fetch_headers(node, fork_height + len(headers), self.headers_batch)['headers']
+            if not more:
+                break
+            headers.extend(more)
+
+        previous_hash = self.blockchain.block_hash(fork_height - 1) if fork_height else None
+        if not headers or not self.blockchain.valid_header_chain(headers, previous_hash):
+            print(f"❌ Cabeceras inválidas de {node}")
+            return None
+
+        return {
+            'node': node,
+            'length': fork_height + len(headers),
+            'fork_height': fork_height,
+            'hashes': [header['hash'] for header in headers]
+        }
+
+    def _probe_legacy(self, node, local_length):
+        """Peer sin /headers: descargar y validar su cadena completa"""
+        response = self._get(node, '/chain', binary=True)
+        response.raise_for_status()
+        length, chain = chain_from_response(response)
+        print(f"📡 Nodo {node} (sin /headers): {length} bloques")
+        if length > local_length:
+            # replace_chain valida solo a partir de la bifurcación
+            return {'node': node, 'length': length, 'chain': chain}
+        return None
+
+    def download(self, candidate):
+        """Descargar y aplicar los bloques del candidato; devuelve los bloques aplicados"""
+        if 'chain' in candidate:
+            return self.blockchain.replace_chain(candidate['chain'])
+
+        node = candidate['node']
+        fork_height = candidate['fork_height']
+        hashes = candidate['hashes']
+        end = fork_height + len(hashes)
+        previous_hash = self.blockchain.block_hash(fork_height - 1) if fork_height else None
+
+        applied = []
+        apply_from = fork_height
+        pending_blocks, pending_hashes = [], []
+        height = fork_height
+        while height < end:
+            blocks = self.fetch_blocks(node, height, min(self.blocks_batch, end - height))
+            if not blocks:
+                print(f"❌ {node} no envió los bloques desde {height}")
+                break
+
+            # Cada cuerpo debe tener el hash de su cabecera y un PoW válido
+            expected = hashes[height - fork_height:height - fork_height + len(blocks)]
+            block_hashes = self.blockchain.valid_segment(height, blocks, previous_hash)
+            if block_hashes is None or block_hashes != expected:
+                print(f"❌ Bloques de {node} no coinciden con sus cabeceras")
+                break
+
+            pending_blocks.extend(blocks)
+            pending_hashes.extend(block_hashes)
+            height += len(blocks)
+            previous_hash = block_hashes[-1]
+
+            # Aplicar en cuanto la cadena nueva supera a la local; después, por lotes
+            if apply_from + len(pending_blocks) > len(self.blockchain.chain):
+                if not self.blockchain.apply_blocks(apply_from, pending_blocks, pending_hashes):
+                    print("⏭️  La cadena local avanzó durante la sincronización")
+                    break
+                applied.extend(pending_blocks)
+                apply_from = height
+                pending_blocks, pending_hashes = [], []
+
+        return applied
+
+    def sync(self):
+        """Ronda de sincronización; devuelve los bloques aplicados (lista vacía si ninguno)"""
+        if not self._round_lock.acquire(blocking=False):
+            print("⏭️  Sincronización ya en curso")
+            return []
+        try:
+            return self._sync_round()
+        finally:
+            self._round_lock.release()
+
+    def _poll_peers(self, nodes):
+        """Consultar a todos los peers en paralelo hasta el quorum o el plazo"""
+        candidates = []
+        answered = failed = 0
+        started = time.time()
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(nodes)),
+                                      thread_name_prefix='sync-probe')
+        futures = {executor.submit(self.probe_peer, node): node for node in nodes}
+        pending = set(futures)
+        deadline = started + self.round_deadline
+        try:
+            while pending and answered < self.quorum:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    print(f"⏰ Ronda cerrada con {answered} de {len(nodes)} peers respondidos")
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    node = futures[future]
+                    try:
+                        candidate = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"❌ Error consultando nodo {node}: {e}")
+                        continue
+                    if not answered:
+                        # Con una respuesta buena ya solo se espera un margen corto
+                        deadline = min(deadline, time.time() + self.answer_grace)
+                    answered += 1
+                    if candidate:
+                        candidates.append(candidate)
+        finally:
+            # Los peers lentos no retienen la ronda: sus respuestas se descartan
+            # (cancel_futures de shutdown() no existe antes de Python 3.9)
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        self.last_round = {
+            'started_at': started,
+            'duration': time.time() - started,
+            'peers': len(nodes),
+            'answered': answered,
+            'failed': failed,
+            'pending': len(nodes) - answered - failed,
+            'candidates': len(candidates)
+        }
+        return candidates
+
+    def _sync_round(self):
+        print("🔄 Iniciando sincronización headers-first...")
+        nodes = list(self.blockchain.nodes)
+        if not nodes:
+            return []
+        candidates = self._poll_peers(nodes)
+
+        # Primero el largo declarado mayor; si sus cuerpos no cuadran, el siguiente
+        for candidate in sorted(candidates, key=lambda c: c['length'], reverse=True):
+            print(f"🎯 Cadena de {candidate['length']} bloques en {candidate['node']}")
+            try:
+                applied = self.download(candidate)
+            except Exception as e:
+                print(f"❌ Error descargando bloques de {candidate['node']}: {e}")
+                continue
+            if applied:
+                print(f"✅ Sincronizado: {len(applied)} bloques aplicados")
+                return applied
+
+        print("✅ Nuestra cadena es la más actualizada")
+        return []
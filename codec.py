@@ -0,0 +1,326 @@
+import struct
+
+# Codificación binaria compacta de bloques y transacciones (disco y red).
+#
+# Es una representación sin pérdida del dict de bloque: decode_block devuelve
+# exactamente el mismo dict (tipos incluidos: 50 y 50.0 no son lo mismo para
+# hash_bloque), así que el hash de consenso no cambia.
+
+MEDIA_TYPE = 'application/x-rudag-blocks'
+
+# Versiones de la codificación de un bloque
+FORMAT_GENERIC = 0x00      # cualquier dict
+FORMAT_STRUCTURED = 0x01   # bloque estándar con campos de ancho fijo
+
+# Etiquetas de valores
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INT = 0x03
+TAG_FLOAT = 0x04
+TAG_STR = 0x05
+TAG_HASH = 0x06       # cadena hex de 64 caracteres -> 32 bytes
+TAG_ADDRESS = 0x07    # referencia a la tabla de direcciones del bloque
+TAG_LIST = 0x08
+TAG_DICT = 0x09
+TAG_CONST = 0x0A      # cadena frecuente por índice
+
+# Claves y cadenas frecuentes; solo se puede AÑADIR al final de cada lista
+KNOWN_KEYS = [
+    'indice', 'hash_anterior', 'transacciones', 'tiempo', 'nonce',
+    'tipo', 'recompensa', 'fees', 'destino', 'timestamp',
+    'monto', 'recibe', 'envia', 'fee', 'hash',
+]
+KNOWN_STRINGS = ['coinbase']
+
+BLOCK_KEYS = ('indice', 'hash_anterior', 'transacciones', 'tiempo', 'nonce')
+ADDRESS_PREFIX = 'RGD:'
+HEX_DIGITS = frozenset('0123456789abcdef')
+
+_KEY_IDS = {key: i for i, key in enumerate(KNOWN_KEYS)}
+_STRING_IDS = {value: i for i, value in enumerate(KNOWN_STRINGS)}
+_DOUBLE = struct.Struct('<d')
+
+
+def _write_uvarint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_uvarint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _is_hash(value):
+    return len(value) == 64 and HEX_DIGITS.issuperset(value)
+
+
+class _Encoder:
+    def __init__(self):
+        self.out = bytearray()
+        self.addresses = {}
+
+    def collect_addresses(self, value):
+        """Recorrer el valor y registrar las direcciones RGD (tabla de interning)"""
+        if isinstance(value, str):
+            if value.startswith(ADDRESS_PREFIX) and value not in self.addresses:
+                self.addresses[value] = len(self.addresses)
+        elif isinstance(value, list):
+            for item in value:
+                self.collect_addresses(item)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self.collect_addresses(item)
+
+    def write_address_table(self):
+        _write_uvarint(self.out, len(self.addresses))
+        for address in self.addresses:
+            self.write_raw_str(address)
+
+    def write_raw_str(self, value):
+        encoded = value.encode('utf-8')
+        _write_uvarint(self.out, len(encoded))
+        self.out += encoded
+
+    def write_key(self, key):
+        # 0 = clave literal; n > 0 = KNOWN_KEYS[n - 1]
+        if key in _KEY_IDS:
+            _write_uvarint(self.out, _KEY_IDS[key] + 1)
+        else:
+            _write_uvarint(self.out, 0)
+            self.write_raw_str(key)
+
+    def write_value(self, value):
+        out = self.out
+        if value is None:
+            out.append(TAG_NONE)
+        elif value is True:
+            out.append(TAG_TRUE)
+        elif value is False:
+            out.append(TAG_FALSE)
+        elif isinstance(value, int):
+            out.append(TAG_INT)
+            # zigzag para enteros con signo
+            _write_uvarint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            out.append(TAG_FLOAT)
+            out += _DOUBLE.pack(value)
+        elif isinstance(value, str):
+            if value in self.addresses:
+                out.append(TAG_ADDRESS)
+                _write_uvarint(out, self.addresses[value])
+            elif value in _STRING_IDS:
+                out.append(TAG_CONST)
+                _write_uvarint(out, _STRING_IDS[value])
+            elif _is_hash(value):
+                out.append(TAG_HASH)
+                out += bytes.fromhex(value)
+            else:
+                out.append(TAG_STR)
+                self.write_raw_str(value)
+        elif isinstance(value, (list, tuple)):
+            out.append(TAG_LIST)
+            _write_uvarint(out, len(value))
+            for item in value:
+                self.write_value(item)
+        elif isinstance(value, dict):
+            out.append(TAG_DICT)
+            _write_uvarint(out, len(value))
+            for key, item in value.items():
+                self.write_key(key)
+                self.write_value(item)
+        else:
+            raise TypeError(f"Tipo no codificable: {type(value).__name__}")
+
+
+class _Decoder:
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+        self.addresses = []
+
+    def uvarint(self):
+        value, self.pos = _read_uvarint(self.data, self.pos)
+        return value
+
+    def raw(self, size):
+        chunk = self.data[self.pos:self.pos + size]
+        if len(chunk) != size:
+            raise ValueError("Datos binarios truncados")
+        self.pos += size
+        return chunk
+
+    def raw_str(self):
+        return bytes(self.raw(self.uvarint())).decode('utf-8')
+
+    def read_address_table(self):
+        self.addresses = [self.raw_str() for _ in range(self.uvarint())]
+
+    def key(self):
+        key_id = self.uvarint()
+        return KNOWN_KEYS[key_id - 1] if key_id else self.raw_str()
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_TRUE:
+            return True
+        if tag == TAG_FALSE:
+            return False
+        if tag == TAG_INT:
+            zigzag = self.uvarint()
+            return zigzag >> 1 if not zigzag & 1 else -((zigzag + 1) >> 1)
+        if tag == TAG_FLOAT:
+            return _DOUBLE.unpack(self.raw(8))[0]
+        if tag == TAG_STR:
+            return self.raw_str()
+        if tag == TAG_HASH:
+            return bytes(self.raw(32)).hex()
+        if tag == TAG_ADDRESS:
+            return self.addresses[self.uvarint()]
+        if tag == TAG_CONST:
+            return KNOWN_STRINGS[self.uvarint()]
+        if tag == TAG_LIST:
+            return [self.value() for _ in range(self.uvarint())]
+        if tag == TAG_DICT:
+            result = {}
+            for _ in range(self.uvarint()):
+                key = self.key()
+                result[key] = self.value()
+            return result
+        raise ValueError(f"Etiqueta desconocida: {tag}")
+
+
+def _is_structured(block):
+    """Bloque estándar: se puede usar el formato de campos de ancho fijo"""
+    return (
+        tuple(block.keys()) == BLOCK_KEYS and
+        type(block['indice']) is int and block['indice'] >= 0 and
+        isinstance(block['hash_anterior'], str) and _is_hash(block['hash_anterior']) and
+        type(block['tiempo']) is float and
+        type(block['nonce']) is int and block['nonce'] >= 0 and
+        isinstance(block['transacciones'], list)
+    )
+
+
+def encode_block(block):
+    """Codificar un dict de bloque en bytes"""
+    encoder = _Encoder()
+    encoder.collect_addresses(block)
+
+    if _is_structured(block):
+        encoder.out.append(FORMAT_STRUCTURED)
+        _write_uvarint(encoder.out, block['indice'])
+        encoder.out += bytes.fromhex(block['hash_anterior'])
+        encoder.out += _DOUBLE.pack(block['tiempo'])
+        _write_uvarint(encoder.out, block['nonce'])
+        encoder.write_address_table()
+        encoder.write_value(block['transacciones'])
+    else:
+        encoder.out.append(FORMAT_GENERIC)
+        encoder.write_address_table()
+        encoder.write_value(block)
+    return bytes(encoder.out)
+
+
+def _decode_block_at(data, pos):
+    decoder = _Decoder(data, pos + 1)
+    block_format = data[pos]
+
+    if block_format == FORMAT_STRUCTURED:
+        indice = decoder.uvarint()
+        hash_anterior = bytes(decoder.raw(32)).hex()
+        tiempo = _DOUBLE.unpack(decoder.raw(8))[0]
+        nonce = decoder.uvarint()
+        decoder.read_address_table()
+        block = {
+            'indice': indice,
+            'hash_anterior': hash_anterior,
+            'transacciones': decoder.value(),
+            'tiempo': tiempo,
+            'nonce': nonce
+        }
+    elif block_format == FORMAT_GENERIC:
+        decoder.read_address_table()
+        block = decoder.value()
+    else:
+        raise ValueError(f"Formato de bloque desconocido: {block_format}")
+    return block, decoder.pos
+
+
+def decode_block(data):
+    """Decodificar bytes de encode_block al dict original"""
+    block, _ = _decode_block_at(data, 0)
+    return block
+
+
+def decode_block_header(data, pos=0):
+    """Cabecera (campos fijos y número de transacciones) de un bloque codificado.
+
+    Lee solo los campos de ancho fijo y salta la tabla de direcciones sin
+    decodificar las transacciones. Devuelve None si el bloque no está en el
+    formato estructurado (hay que decodificarlo entero).
+    """
+    if data[pos] != FORMAT_STRUCTURED:
+        return None
+    decoder = _Decoder(data, pos + 1)
+    indice = decoder.uvarint()
+    hash_anterior = bytes(decoder.raw(32)).hex()
+    tiempo = _DOUBLE.unpack(decoder.raw(8))[0]
+    nonce = decoder.uvarint()
+    for _ in range(decoder.uvarint()):
+        size = decoder.uvarint()
+        decoder.pos += size
+    if decoder.raw(1)[0] != TAG_LIST:
+        raise ValueError("Bloque sin lista de transacciones")
+    return {
+        'indice': indice,
+        'hash_anterior': hash_anterior,
+        'tiempo': tiempo,
+        'nonce': nonce,
+        'n_tx': decoder.uvarint()
+    }
+
+
+def encode_blocks(blocks):
+    """Codificar una lista de bloques para transferirla entre nodos"""
+    out = bytearray()
+    _write_uvarint(out, len(blocks))
+    for block in blocks:
+        encoded = encode_block(block)
+        _write_uvarint(out, len(encoded))
+        out += encoded
+    return bytes(out)
+
+
+def decode_blocks(data):
+    """Decodificar una lista de bloques de encode_blocks"""
+    count, pos = _read_uvarint(data, 0)
+    blocks = []
+    for _ in range(count):
+        size, pos = _read_uvarint(data, pos)
+        block, _ = _decode_block_at(data, pos)
+        blocks.append(block)
+        pos += size
+    return blocks
+
+
+def chain_from_response(response):
+    """Leer (largo, cadena) de una respuesta de /chain en binario o JSON"""
+    if response.headers.get('Content-Type', '').startswith(MEDIA_TYPE):
+        chain = decode_blocks(response.content)
+        return len(chain), chain
+
+    data = response.json()
+    return data['largo'], data['chain']
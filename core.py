@@ -2,11 +2,21 @@ import json
 import os
 import requests
 import time
+import threading
 from hashlib import sha256
 from urllib.parse import urlparse
 import ecdsa
 import base58
 import hashlib
+from block_store import BlockStore, ChainView
+import atexit
+from state_store import JournaledList, PersistenceScheduler
+from balance_index import BalanceIndex
+from supply_index import SupplyIndex
+from chain_sync import ChainSync
+from peer_client import PeerClient
+from mempool import Mempool, MempoolRejected, transaction_id
+from tx_index import TxIndex
 
 # Cargar configuración RGD
 with open('config.json', 'r') as f:
@@ -27,11 +37,83 @@ class RGDBlockchainConfig:
     BLOCKCHAIN_FILE = config['blockchain_file']
     GENESIS_ADDRESS = config['genesis_address']
     AUTOMATIC_PEER_DISCOVERY = config['automatic_peer_discovery']
+    MINING_WORKERS = config.get('mining_workers', 0)  # 0 = un worker por núcleo
+    BLOCK_STORE_DIR = config.get('block_store_dir', 'blocks')
+    BLOCK_SEGMENT_SIZE = config.get('block_segment_size', 16 * 1024 * 1024)
+    MEMPOOL_FILE = config.get('mempool_file', 'mempool.json')
+    PEERS_FILE = config.get('peers_file', 'peers.json')
+    PERSISTENCE_FLUSH_INTERVAL_MS = config.get('persistence_flush_interval_ms', 200)
+    BLOCK_CACHE_SIZE = config.get('block_cache_size', 256)
+    BALANCE_INDEX_FILE = config.get('balance_index_file', 'balances.json')
+    BALANCE_CHECKPOINT_INTERVAL = config.get('balance_checkpoint_interval', 100)
+    SYNC_HEADERS_BATCH = config.get('sync_headers_batch', 2000)
+    SYNC_BLOCKS_BATCH = config.get('sync_blocks_batch', 500)
+    SYNC_TIMEOUT = config.get('sync_timeout', 15)
+    SYNC_MAX_WORKERS = config.get('sync_max_workers', 16)
+    SYNC_ROUND_DEADLINE = config.get('sync_round_deadline', 20)
+    SYNC_QUORUM = config.get('sync_quorum', 3)
+    SYNC_ANSWER_GRACE = config.get('sync_answer_grace', 2)
+    PEER_DEFAULT_PORT = config.get('peer_default_port', 5000)
+    PEER_RETRY_INTERVAL = config.get('peer_retry_interval', 30)
+    PEER_MAX_RETRY_INTERVAL = config.get('peer_max_retry_interval', 300)
+    PEER_POOL_HOSTS = config.get('peer_pool_hosts', 64)
+    PEER_POOL_SIZE = config.get('peer_pool_size', 4)
+    PEER_MAX_CONCURRENCY = config.get('peer_max_concurrency', 32)
+    PEER_CONNECT_TIMEOUT = config.get('peer_connect_timeout', 3)
+    PEER_READ_TIMEOUT = config.get('peer_read_timeout', 10)
+    BROADCAST_QUEUE_SIZE = config.get('broadcast_queue_size', 1000)
+    TX_RELAY_WINDOW_MS = config.get('tx_relay_window_ms', 100)
+    TX_RELAY_MAX_BATCH = config.get('tx_relay_max_batch', 200)
+    INVENTORY_MAX_ITEMS = config.get('inventory_max_items', 10000)
+    INVENTORY_KNOWN_PER_PEER = config.get('inventory_known_per_peer', 5000)
+    SEEN_CACHE_SIZE = config.get('seen_cache_size', 20000)
+    SEEN_CACHE_TTL = config.get('seen_cache_ttl', 600)
+    MEMPOOL_MAX_TRANSACTIONS = config.get('mempool_max_transactions', 50000)
+    MEMPOOL_MAX_BYTES = config.get('mempool_max_bytes', 33554432)
+    MEMPOOL_TTL = config.get('mempool_ttl', 259200)
 
 def hash_bloque(bloque):
     bloque_encode = json.dumps(bloque, sort_keys=True).encode()
     return sha256(bloque_encode).hexdigest()
 
+class MidstateHasher:
+    """Hashea las variantes de un bloque que solo difieren en el nonce.
+
+    La parte invariante del bloque se serializa una sola vez: el prefijo
+    (claves ordenadas antes de 'nonce') queda absorbido en un estado SHA-256
+    que se clona con .copy() en cada intento, y el sufijo ('tiempo',
+    'transacciones') se guarda ya codificado. El resultado es idéntico byte a
+    byte a hash_bloque(bloque).
+    """
+
+    def __init__(self, bloque):
+        antes = {k: v for k, v in bloque.items() if k < 'nonce'}
+        despues = {k: v for k, v in bloque.items() if k > 'nonce'}
+
+        if antes:
+            prefijo = json.dumps(antes, sort_keys=True)[:-1] + ', "nonce": '
+        else:
+            prefijo = '{"nonce": '
+        if despues:
+            sufijo = ', ' + json.dumps(despues, sort_keys=True)[1:]
+        else:
+            sufijo = '}'
+
+        self.prefijo = prefijo.encode()
+        self.sufijo = sufijo.encode()
+        self._midstate = sha256(self.prefijo)
+
+    def hash(self, nonce):
+        """Hash hexadecimal del bloque con el nonce indicado"""
+        h = self._midstate.copy()
+        h.update(str(nonce).encode())
+        h.update(self.sufijo)
+        return h.hexdigest()
+
+    def cumple(self, nonce, dificultad):
+        """Indica si el nonce satisface la dificultad"""
+        return self.hash(nonce)[:len(dificultad)] == dificultad
+
 def calculate_reward(block_height):
     """Calcula la recompensa según el halving schedule de RGD"""
     if block_height == 0:
@@ -77,41 +159,169 @@ class Blockchain:
     def __init__(self, node_id="unknown"):
         self.node_id = node_id
         self.nodes = set()
-        self.chain = []
-        self.transacciones_pendientes = []
+        # Serializa las modificaciones de la cadena entre API, red y minero
+        self.lock = threading.RLock()
+        # Transacciones pendientes por id de contenido, con índice por fee,
+        # acotadas en número, bytes y antigüedad
+        self.mempool = Mempool(
+            lock=self.lock,
+            max_count=RGDBlockchainConfig.MEMPOOL_MAX_TRANSACTIONS,
+            max_bytes=RGDBlockchainConfig.MEMPOOL_MAX_BYTES,
+            ttl=RGDBlockchainConfig.MEMPOOL_TTL
+        )
+        # Se incrementa cada vez que cambia la punta de la cadena
+        self.tip_version = 0
+        # Los bloques viven en segmentos append-only, fuera de BLOCKCHAIN_FILE
+        self.store = BlockStore(
+            RGDBlockchainConfig.BLOCK_STORE_DIR,
+            hash_bloque,
+            RGDBlockchainConfig.BLOCK_SEGMENT_SIZE,
+            RGDBlockchainConfig.BLOCK_CACHE_SIZE
+        )
+        # Vista perezosa: los bloques se leen del almacén al accederlos
+        self.chain = ChainView(self.store)
+        # Supply y fees acumulados por altura, junto a los bloques
+        self.supply = SupplyIndex(os.path.join(RGDBlockchainConfig.BLOCK_STORE_DIR, 'supply.dat'))
+        # Id de transacción -> (altura, posición) de las confirmadas
+        self.tx_index = TxIndex(os.path.join(RGDBlockchainConfig.BLOCK_STORE_DIR, 'txindex.db'))
+        # Mempool y peers tienen su propio almacén, independiente de la cadena;
+        # las transacciones expulsadas o caducadas salen con un tombstone por id
+        self.mempool_store = JournaledList(
+            RGDBlockchainConfig.MEMPOOL_FILE,
+            source=lambda: list(self.mempool),
+            lock=self.lock,
+            key=transaction_id
+        )
+        self.peer_store = JournaledList(
+            RGDBlockchainConfig.PEERS_FILE,
+            source=lambda: list(self.nodes),
+            lock=self.lock
+        )
+        # Balances por dirección, actualizados al añadir o quitar bloques
+        self.balances = BalanceIndex(
+            RGDBlockchainConfig.BALANCE_INDEX_FILE,
+            lock=self.lock,
+            checkpoint_every=RGDBlockchainConfig.BALANCE_CHECKPOINT_INTERVAL
+        )
+        # Los cambios de mempool, peers y balances se vuelcan agrupados en segundo plano
+        self.persistence = PersistenceScheduler(
+            [self.mempool_store, self.peer_store, self.balances],
+            RGDBlockchainConfig.PERSISTENCE_FLUSH_INTERVAL_MS
+        )
+        # Toda la comunicación con peers pasa por el registro de endpoints
+        # y un pool de conexiones keep-alive compartido
+        self.peer_client = PeerClient(
+            RGDBlockchainConfig.PEER_DEFAULT_PORT,
+            RGDBlockchainConfig.PEER_RETRY_INTERVAL,
+            RGDBlockchainConfig.PEER_MAX_RETRY_INTERVAL,
+            RGDBlockchainConfig.PEER_POOL_HOSTS,
+            RGDBlockchainConfig.PEER_POOL_SIZE,
+            RGDBlockchainConfig.PEER_MAX_CONCURRENCY,
+            RGDBlockchainConfig.PEER_CONNECT_TIMEOUT,
+            RGDBlockchainConfig.PEER_READ_TIMEOUT
+        )
+        # Sincronización headers-first con los peers
+        self.chain_sync = ChainSync(
+            self,
+            RGDBlockchainConfig.SYNC_HEADERS_BATCH,
+            RGDBlockchainConfig.SYNC_BLOCKS_BATCH,
+            RGDBlockchainConfig.SYNC_TIMEOUT,
+            RGDBlockchainConfig.SYNC_MAX_WORKERS,
+            RGDBlockchainConfig.SYNC_ROUND_DEADLINE,
+            RGDBlockchainConfig.SYNC_QUORUM,
+            RGDBlockchainConfig.SYNC_ANSWER_GRACE
+        )
         self.load_blockchain()
+        self.persistence.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Volcar el estado pendiente a disco (al apagar el nodo)"""
+        if self.persistence.running:
+            self.balances.request_checkpoint()
+            self.persistence.stop()
+        self.peer_client.close()
+        self.tx_index.close()
+        self.store.close()
     
     def load_blockchain(self):
-        """Cargar blockchain desde archivo si existe"""
+        """Cargar bloques, transacciones pendientes y peers de sus almacenes"""
+        # Migración única desde el formato antiguo (todo en BLOCKCHAIN_FILE)
         if os.path.exists(RGDBlockchainConfig.BLOCKCHAIN_FILE):
             try:
-                with open(RGDBlockchainConfig.BLOCKCHAIN_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.chain = data['chain']
-                    self.nodes = set(data['nodes'])
-                    self.transacciones_pendientes = data['transacciones_pendientes']
-                print(f"✅ Blockchain cargada desde {RGDBlockchainConfig.BLOCKCHAIN_FILE}")
-                print(f"📦 Bloques: {len(self.chain)} | Nodos: {len(self.nodes)}")
-                return
+                self.migrate_from_json()
+            except Exception as e:
+                print(f"❌ Error migrando {RGDBlockchainConfig.BLOCKCHAIN_FILE}: {e}")
+        
+        try:
+            self.nodes = set(self.peer_store.load())
+            pending = self.mempool_store.load()
+            self.mempool.load(pending)
+            # Lo caducado o lo que ya no cabe con los límites actuales sale del snapshot
+            if self.mempool.enforce_limits() or len(self.mempool) < len(pending):
+                self.save_mempool()
+        except Exception as e:
+            print(f"❌ Error cargando mempool/peers: {e}")
+        
+        self.supply.load(self.chain, self.store.block_hash)
+        self.tx_index.load(self.chain, self.store.block_hash)
+        if len(self.store) > 0:
+            try:
+                self.balances.load(self.chain, self.store.block_hash)
             except Exception as e:
-                print(f"❌ Error cargando blockchain: {e}")
+                print(f"❌ Error cargando índice de balances: {e}")
+            print(f"✅ Blockchain cargada desde {RGDBlockchainConfig.BLOCK_STORE_DIR}")
+            print(f"📦 Bloques: {len(self.chain)} | Nodos: {len(self.nodes)}")
+            return
         
         # Si no existe, crear bloque génesis
         self.create_genesis_block()
 
+    def migrate_from_json(self):
+        """Repartir BLOCKCHAIN_FILE entre el almacén de bloques, la mempool y los peers"""
+        with open(RGDBlockchainConfig.BLOCKCHAIN_FILE, 'r') as f:
+            data = json.load(f)
+        
+        chain = data.get('chain', [])
+        if len(self.store) == 0 and chain:
+            print(f"🔄 Migrando {len(chain)} bloques de {RGDBlockchainConfig.BLOCKCHAIN_FILE} "
+                  f"a {RGDBlockchainConfig.BLOCK_STORE_DIR}...")
+            self.store.append_many(chain)
+        if not self.peer_store.exists():
+            self.peer_store.write_snapshot(data.get('nodes', []))
+        if not self.mempool_store.exists():
+            self.mempool_store.write_snapshot(data.get('transacciones_pendientes', []))
+        
+        os.replace(RGDBlockchainConfig.BLOCKCHAIN_FILE, RGDBlockchainConfig.BLOCKCHAIN_FILE + '.bak')
+        print(f"✅ Migración completada ({RGDBlockchainConfig.BLOCKCHAIN_FILE} → .bak)")
+
     def save_blockchain(self):
-        """Guardar blockchain en archivo"""
-        data = {
-            'chain': self.chain,
-            'nodes': list(self.nodes),
-            'transacciones_pendientes': self.transacciones_pendientes
-        }
+        """Guardar ya transacciones pendientes y peers (los bloques van al BlockStore)"""
+        self.save_mempool()
+        self.save_peers()
+        return self.flush_state()
+
+    def save_mempool(self):
+        """Marcar la mempool para snapshot en el próximo volcado"""
+        self.mempool_store.mark_snapshot()
+
+    def _journal_removed(self, tx_ids):
+        """Registrar en el journal de la mempool las transacciones confirmadas,
+        expulsadas o caducadas, sin reescribir el snapshot"""
+        for tx_id in tx_ids:
+            self.mempool_store.discard(tx_id)
+
+    def save_peers(self):
+        """Marcar la libreta de peers para snapshot en el próximo volcado"""
+        self.peer_store.mark_snapshot()
+
+    def flush_state(self):
+        """Forzar el volcado inmediato del estado pendiente"""
         try:
-            with open(RGDBlockchainConfig.BLOCKCHAIN_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            self.persistence.flush()
             return True
         except Exception as e:
-            print(f"❌ Error guardando blockchain: {e}")
+            print(f"❌ Error guardando estado: {e}")
             return False
 
     def create_genesis_block(self, genesis_wallet_address=None):
@@ -122,7 +332,7 @@ class Blockchain:
         mensaje_genesis = f"""RUDAG_GENESIS_BLOCK: 
         {RGDBlockchainConfig.NAME} - {RGDBlockchainConfig.TICKER}
         Bloque Génesis - Recompensa: {RGDBlockchainConfig.GENESIS_REWARD} {RGDBlockchainConfig.SYMBOL}
-        Timestamp: {time()}
+        Timestamp: {time.time()}
         Dirección Génesis Fija: {genesis_wallet_address}"""
         
         hash_genesis = hash_bloque(mensaje_genesis)
@@ -133,36 +343,102 @@ class Blockchain:
             'recompensa': RGDBlockchainConfig.GENESIS_REWARD,
             'fees': 0,
             'destino': genesis_wallet_address,
-            'timestamp': time()
+            'timestamp': time.time()
         }
         
-        genesis_block = self.proof_of_work(0, hash_genesis, [genesis_transaction], time())
+        genesis_block = self.proof_of_work(0, hash_genesis, [genesis_transaction], time.time())
         self.nuevo_bloque(genesis_block)
-        self.save_blockchain()
         print(f"✅ Bloque génesis FIJO creado para: {genesis_wallet_address}")
 
     def proof_of_work(self, indice, hash_anterior, transacciones, tiempo):
         nonce = 0
         bloque = Bloque(indice, hash_anterior, transacciones, tiempo, nonce)
-        while self.validar_pow(bloque.__dict__) is False:
+        # Solo el nonce cambia entre intentos: no re-serializar el bloque
+        hasher = MidstateHasher(bloque.__dict__)
+        while not hasher.cumple(bloque.nonce, self.dificultad):
             bloque.nonce += 1
         return bloque
 
-    def validar_pow(self, bloque):
-        hash_bloque_nuevo = hash_bloque(bloque)
+    def validar_pow(self, bloque, hash_bloque_nuevo=None):
+        if hash_bloque_nuevo is None:
+            hash_bloque_nuevo = hash_bloque(bloque)
         return hash_bloque_nuevo[:len(self.dificultad)] == self.dificultad
 
-    def nuevo_bloque(self, bloque):
+    def nuevo_bloque(self, bloque, block_hash=None):
         # Verificar límite de transacciones
         if len(bloque.transacciones) > RGDBlockchainConfig.MAX_TX_PER_BLOCK:
             raise Exception(f"Límite de transacciones excedido: {RGDBlockchainConfig.MAX_TX_PER_BLOCK}")
         
-        self.transacciones_pendientes = []
-        self.chain.append(bloque.__dict__)
-        self.save_blockchain()
-        return bloque    
+        with self.lock:
+            # El hash se calcula una vez aquí (o lo trae quien ya lo validó)
+            height = self.store.append(bloque.__dict__, block_hash)
+            block_hash = self.store.block_hash(height)
+            self.supply.append(bloque.__dict__, block_hash)
+            self.tx_index.append(bloque.__dict__, block_hash)
+            self.balances.apply_block(bloque.__dict__, block_hash)
+            self.tip_version += 1
+            # Solo salen de la mempool las transacciones incluidas en el bloque
+            self._cleanup_pending_transactions([bloque.__dict__])
+            # Un bloque nuevo fuerza el volcado: la mempool no puede quedar atrás
+            self.flush_state()
+        return bloque
+
+    def replace_chain(self, new_chain):
+        """Adoptar una cadena completa recibida si es más larga que la local.
+
+        Solo se validan y se escriben los bloques a partir del punto de
+        bifurcación. Devuelve los bloques aplicados (lista vacía si no se adopta).
+        """
+        if len(new_chain) <= len(self.chain):
+            return []
+        
+        # Punto de bifurcación: primer bloque cuyo hash no coincide con el nuestro
+        fork_height, previous_hash = 0, None
+        while fork_height < min(len(self.chain), len(new_chain)):
+            block_hash = hash_bloque(new_chain[fork_height])
+            if block_hash != self.store.block_hash(fork_height):
+                break
+            fork_height, previous_hash = fork_height + 1, block_hash
+        
+        segment = new_chain[fork_height:]
+        hashes = self.valid_segment(fork_height, segment, previous_hash)
+        if hashes is None:
+            print(f"❌ Cadena recibida inválida a partir del bloque {fork_height}")
+            return []
+        return segment if self.apply_blocks(fork_height, segment, hashes) else []
+
+    def apply_blocks(self, fork_height, blocks, hashes):
+        """Sustituir la cadena desde `fork_height` por `blocks` (ya validados).
+
+        Solo se aplica si los bloques siguen encajando sobre la altura
+        `fork_height` y dejan la cadena más larga que la actual.
+        """
+        with self.lock:
+            if fork_height > len(self.chain) or fork_height + len(blocks) <= len(self.chain):
+                return False
+            if fork_height > 0 and blocks and blocks[0]['hash_anterior'] != self.store.block_hash(fork_height - 1):
+                return False
+            
+            self.store.truncate(fork_height)
+            self.supply.truncate(fork_height)
+            self.tx_index.truncate(fork_height)
+            self.balances.rollback_to(fork_height, self.chain, self.store.block_hash)
+            self.store.append_many(blocks, hashes)
+            self.supply.append_many(blocks, hashes)
+            self.tx_index.append_many(blocks, hashes)
+            for block, block_hash in zip(blocks, hashes):
+                self.balances.apply_block(block, block_hash)
+            self.tip_version += 1
+            self._cleanup_pending_transactions(blocks)
+        return True
+
+    def add_transaction(self, envia, recibe, monto, fee=RGDBlockchainConfig.TRANSACTION_FEE, timestamp=None):
+        """Añadir una transacción pendiente.
 
-    def add_transaction(self, envia, recibe, monto, fee=RGDBlockchainConfig.TRANSACTION_FEE):
+        Las recibidas de otros nodos conservan su `timestamp` original, así
+        que tienen el mismo id (hash de contenido) en toda la red; si ya
+        estaba en la mempool no se añade de nuevo.
+        """
         # Verificar formato de dirección RGD
         if not recibe.startswith('RGD:'):
             raise Exception("Formato de dirección RGD inválido")
@@ -176,26 +452,103 @@ class Blockchain:
             'recibe': recibe,
             'envia': envia,
             'fee': fee,
-            'timestamp': time.time(),
+            'timestamp': time.time() if timestamp is None else timestamp,
             'hash': None
         }
         
-        self.transacciones_pendientes.append(transaction_data)
-        self.save_blockchain()
+        with self.lock:
+            tx_id = self.mempool.add(transaction_data)
+            if tx_id:
+                # Si la mempool se pasa de tamaño sale lo de menor fee por byte
+                removed = self.mempool.enforce_limits()
+                # La nueva aún no está en el journal: no necesita tombstone
+                self._journal_removed([removed_id for removed_id in removed if removed_id != tx_id])
+                if tx_id in removed:
+                    raise MempoolRejected("Mempool llena: fee insuficiente para entrar")
+                self.mempool_store.append(transaction_data)
         return self.last_block['indice'] + 1
 
+    def create_block_template(self, mining_wallet):
+        """Preparar el siguiente bloque a minar: coinbase + pendientes de mayor fee.
+
+        Se eligen como mucho MAX_TX_PER_BLOCK - 1 transacciones (la coinbase
+        ocupa un hueco) antes de minar, así que el bloque nunca excede el
+        límite; las demás siguen en la mempool para bloques siguientes.
+        """
+        with self.lock:
+            self._journal_removed(self.mempool.enforce_limits())
+            selected = self.mempool.top(RGDBlockchainConfig.MAX_TX_PER_BLOCK - 1)
+            # Recompensa actual + fees de las transacciones elegidas
+            current_reward = self.get_current_reward()
+            total_fees = sum(tx.get('fee', 0) for tx in selected)
+
+            # Crear transacción coinbase
+            coinbase_tx = {
+                'tipo': 'coinbase',
+                'recompensa': current_reward,
+                'fees': total_fees,
+                'destino': mining_wallet,
+                'timestamp': time.time()
+            }
+
+            return {
+                'indice': len(self.chain),
+                'hash_anterior': self.last_block_hash or "0" * 64,
+                'transacciones': [coinbase_tx] + selected,
+                'recompensa': current_reward,
+                'fees': total_fees
+            }
+
     @property
     def last_block(self):
         return self.chain[-1] if self.chain else None
 
+    @property
+    def last_block_hash(self):
+        """Hash de la punta, leído del almacén sin rehashear el bloque"""
+        return self.store.block_hash(len(self.store) - 1) if len(self.store) else None
+
+    def block_hash(self, height):
+        """Hash del bloque de una altura"""
+        return self.store.block_hash(height)
+
+    def get_block_by_hash(self, block_hash):
+        """Devuelve (altura, bloque) del bloque con ese hash, o None"""
+        with self.lock:
+            height = self.store.height_of(block_hash)
+            if height is None:
+                return None
+            return height, self.chain[height]
+
+    def get_transaction(self, tx_id):
+        """Estado de una transacción por id: confirmada (con su bloque), pendiente o None"""
+        with self.lock:
+            found = self.tx_index.lookup(tx_id)
+            if found is not None:
+                height, position = found
+                return {
+                    'hash': tx_id,
+                    'estado': 'confirmada',
+                    'altura': height,
+                    'posicion': position,
+                    'bloque_hash': self.store.block_hash(height),
+                    'confirmaciones': len(self.chain) - height,
+                    'transaccion': self.chain[height]['transacciones'][position]
+                }
+            pending = self.mempool.get(tx_id)
+            if pending is not None:
+                return {'hash': tx_id, 'estado': 'pendiente', 'transaccion': pending}
+            return None
+
     def add_node(self, address):
         parsed_url = urlparse(address)
         # Extraer solo el hostname para almacenamiento consistente
         node_address = parsed_url.netloc or parsed_url.path
         
         if node_address not in self.nodes:
-            self.nodes.add(node_address)
-            self.save_blockchain()
+            with self.lock:
+                self.nodes.add(node_address)
+                self.peer_store.append(node_address)
             print(f"✅ Nodo añadido: {node_address}")
             
             # Compartir automáticamente con otros nodos si está habilitado
@@ -211,15 +564,15 @@ class Blockchain:
             if node != new_node:  # No enviar a sí mismo
                 try:
                     # Enviar mensaje de nuevo peer a nodos existentes
-                    requests.post(
-                        f"http://{node}/network/receive",
+                    self.peer_client.post(
+                        node,
+                        '/network/receive',
                         json={
                             'type': 'new_peer',
                             'data': {'node': new_node},
                             'timestamp': time.time(),
                             'node_id': self.node_id
-                        },
-                        timeout=5
+                        }
                     )
                     print(f"✅ Nodo {new_node} compartido con {node}")
                 except Exception as e:
@@ -228,132 +581,132 @@ class Blockchain:
     def share_peers_list(self, target_node):
         """Compartir lista completa de peers con un nodo específico"""
         try:
-            requests.post(
-                f"http://{target_node}/network/receive",
+            self.peer_client.post(
+                target_node,
+                '/network/receive',
                 json={
                     'type': 'peers_list',
                     'data': {'peers': list(self.nodes)},
                     'timestamp': time.time(),
                     'node_id': self.node_id
-                },
-                timeout=5
+                }
             )
             print(f"✅ Lista de peers compartida con {target_node}")
         except Exception as e:
             print(f"❌ Error compartiendo peers con {target_node}: {e}")
 
     def update_blockchain(self):
-        """Sincronizar con la cadena más larga válida"""
-        neighbours = self.nodes
-        new_chain = None 
-        max_length = len(self.chain)
-        
-        print(f"🔍 Buscando cadenas más largas en {len(neighbours)} nodos...")
-        
-        for node in neighbours:
-            try:
-                print(f"🔄 Consultando nodo: {node}")
-                
-                # Intentar tanto HTTP como HTTPS
-                protocols = ['https', 'http']
-                success = False
-                
-                for protocol in protocols:
-                    try:
-                        url = f"{protocol}://{node}/chain"
-                        response = requests.get(url, timeout=15)
-                        if response.status_code == 200:
-                            node_data = response.json()
-                            length = node_data['largo']
-                            chain = node_data['chain']
-                            
-                            print(f"📊 Nodo {node} ({protocol}): {length} bloques")
-                            
-                            if length > max_length and self.valid_chain(chain):
-                                max_length = length
-                                new_chain = chain
-                                print(f"✅ Cadena más larga encontrada: {length} bloques")
-                            
-                            success = True
-                            break
-                    except Exception as e:
-                        print(f"   ❌ {protocol}://{node} falló: {e}")
-                        continue
-                
-                if not success:
-                    print(f"❌ No se pudo conectar a {node} con ningún protocolo")
-                        
-            except Exception as e:
-                print(f"❌ Error consultando nodo {node}: {e}")
-        
-        if new_chain:
-            print(f"🔄 Actualizando cadena local a {max_length} bloques")
-            self.chain = new_chain
-            self.save_blockchain()
-            
-            # Limpiar transacciones pendientes que ya están en la nueva cadena
-            self._cleanup_pending_transactions()
-            
-            return True
-        
-        print("✅ Nuestra cadena es la más actualizada")
-        return False
+        """Sincronizar con la mejor cadena de los peers (headers-first)"""
+        # apply_blocks ya quita de la mempool lo confirmado en los bloques nuevos
+        return bool(self.chain_sync.sync())
 
-    def _cleanup_pending_transactions(self):
-        """Limpiar transacciones pendientes que ya están en bloques confirmados"""
-        confirmed_transactions = []
-        for block in self.chain:
-            confirmed_transactions.extend(block.get('transacciones', []))
-        
-        new_pending = []
-        for pending_tx in self.transacciones_pendientes:
-            is_confirmed = False
-            for confirmed_tx in confirmed_transactions:
-                if (pending_tx.get('envia') == confirmed_tx.get('envia') and
-                    pending_tx.get('recibe') == confirmed_tx.get('recibe') and
-                    pending_tx.get('monto') == confirmed_tx.get('monto')):
-                    is_confirmed = True
+    def block_locator(self):
+        """Hashes de la cadena local a alturas espaciadas exponencialmente.
+
+        Las 10 últimas alturas una a una y después con saltos que se doblan,
+        terminando siempre en el génesis: un peer encuentra con ellos el
+        último bloque común en una sola consulta.
+        """
+        with self.lock:
+            locator = []
+            height, step = len(self.chain) - 1, 1
+            while height > 0:
+                locator.append(self.store.block_hash(height))
+                if len(locator) >= 10:
+                    step *= 2
+                height -= step
+            if len(self.chain):
+                locator.append(self.store.block_hash(0))
+            return locator
+
+    def locate_fork(self, locator):
+        """Altura siguiente al primer hash del locator que está en nuestra cadena"""
+        for block_hash in locator:
+            height = self.store.height_of(block_hash)
+            if height is not None:
+                return height + 1
+        return 0
+
+    def get_headers(self, start, count):
+        """Cabeceras de los bloques [start, start + count): sin transacciones.
+
+        Se leen los campos fijos de cada registro y el hash de hashes.dat,
+        sin decodificar las transacciones ni llenar la caché de bloques. El
+        lock se toma por cabecera: una petición grande no frena al minero ni
+        a la red, y si un reorg la cruza el peer ve cabeceras que no
+        encadenan y las descarta.
+        """
+        headers = []
+        for height in range(start, start + count):
+            with self.lock:
+                if height >= len(self.chain):
                     break
+                header = self.store.read_header(height)
+                header['hash'] = self.store.block_hash(height)
+            headers.append(header)
+        return headers
+
+    def valid_header_chain(self, headers, previous_hash):
+        """Validar la forma de unas cabeceras: alturas consecutivas y encadenado.
+
+        El hash de un bloque cubre sus transacciones, así que el `hash` que
+        declara el peer no se puede recalcular desde la cabecera: el PoW solo
+        se comprueba con los cuerpos (valid_segment al descargarlos).
+        """
+        for i, header in enumerate(headers):
+            if i > 0 and header['indice'] != headers[i - 1]['indice'] + 1:
+                return False
+            if previous_hash is not None and header['hash_anterior'] != previous_hash:
+                return False
+            previous_hash = header['hash']
+        return True
+
+    def valid_segment(self, start_height, blocks, previous_hash):
+        """Validar bloques que continúan la cadena desde `start_height`.
+
+        Comprueba alturas, encadenado con `previous_hash`, PoW y, si incluye
+        el génesis, la dirección génesis fija. Devuelve los hashes de los
+        bloques (cada uno calculado una sola vez) o None si no son válidos.
+        """
+        hashes = []
+        for height, block in enumerate(blocks, start_height):
+            if block.get('indice') != height:
+                return None
+            block_hash = hash_bloque(block)
             
-            if not is_confirmed:
-                new_pending.append(pending_tx)
-        
-        removed_count = len(self.transacciones_pendientes) - len(new_pending)
-        if removed_count > 0:
-            print(f"🧹 {removed_count} transacciones limpiadas (ya confirmadas)")
+            if height == 0:
+                # Verificar bloque génesis - DEBE SER EL FIJADO
+                genesis_tx = block['transacciones'][0]
+                if genesis_tx.get('destino') != RGDBlockchainConfig.GENESIS_ADDRESS:
+                    print(f"❌ Bloque génesis incorrecto. Esperado: {RGDBlockchainConfig.GENESIS_ADDRESS}")
+                    return None
+            else:
+                # Verificar hash anterior y proof of work
+                if block['hash_anterior'] != previous_hash:
+                    return None
+                if not self.validar_pow(block, block_hash):
+                    return None
+            
+            hashes.append(block_hash)
+            previous_hash = block_hash
+        return hashes
+
+    def _cleanup_pending_transactions(self, blocks):
+        """Quitar de la mempool las transacciones de bloques confirmados (por id)"""
+        removed = []
+        for block in blocks:
+            removed += self.mempool.remove_confirmed(block.get('transacciones', []))
         
-        self.transacciones_pendientes = new_pending
-        self.save_blockchain()
+        if removed:
+            print(f"🧹 {len(removed)} transacciones limpiadas (ya confirmadas)")
+            # Cada bloque añade solo unas bajas al journal, no un snapshot
+            self._journal_removed(removed)
 
     def valid_chain(self, chain):
         """Validar una cadena completa"""
         if not chain:
             return False
-            
-        # Verificar bloque génesis - DEBE SER EL FIJADO
-        if chain[0]['indice'] != 0:
-            return False
-            
-        # Verificar dirección génesis correcta
-        genesis_tx = chain[0]['transacciones'][0]
-        if genesis_tx.get('destino') != RGDBlockchainConfig.GENESIS_ADDRESS:
-            print(f"❌ Bloque génesis incorrecto. Esperado: {RGDBlockchainConfig.GENESIS_ADDRESS}")
-            return False
-            
-        # Verificar cada bloque subsequente
-        for i in range(1, len(chain)):
-            block = chain[i]
-            previous_block = chain[i-1]
-            
-            # Verificar hash anterior
-            if block['hash_anterior'] != hash_bloque(previous_block):
-                return False
-                
-            # Verificar proof of work
-            if not self.validar_pow(block):
-                return False
-                
-        return True
+        return self.valid_segment(0, chain, None) is not None
 
     def get_current_reward(self):
         """Obtiene la recompensa actual según la altura del bloque"""
@@ -369,10 +722,11 @@ class Blockchain:
             'block_height': len(self.chain),
             'current_reward': self.get_current_reward(),
             'total_supply': self.get_total_supply(),
+            'total_fees': self.get_total_fees(),
             'max_supply': RGDBlockchainConfig.MAX_SUPPLY,
             'difficulty': self.dificultad,
             'nodes': list(self.nodes),
-            'pending_transactions': len(self.transacciones_pendientes),
+            'pending_transactions': len(self.mempool),
             'genesis_address': RGDBlockchainConfig.GENESIS_ADDRESS
         }
 
@@ -381,22 +735,36 @@ class Blockchain:
         # IGNORAR el parámetro y usar siempre la dirección fija
         genesis_wallet_address = RGDBlockchainConfig.GENESIS_ADDRESS
         
-        self.chain = []
-        self.nodes = set()
-        self.transacciones_pendientes = []
-        self.create_genesis_block(genesis_wallet_address)
+        with self.lock:
+            self.store.truncate(0)
+            self.supply.truncate(0)
+            self.tx_index.truncate(0)
+            self.balances.reset()
+            self.balances.request_checkpoint()
+            self.nodes = set()
+            self.mempool.clear()
+            self.tip_version += 1
+            self.create_genesis_block(genesis_wallet_address)
         self.save_blockchain()
         
         print(f"✅ Blockchain reiniciada con dirección génesis fija: {genesis_wallet_address}")
 
     def get_total_supply(self):
-        """Calcular el supply total recorriendo todos los bloques"""
-        total = 0
-        for block in self.chain:
-            for tx in block.get('transacciones', []):
-                if tx.get('tipo') == 'coinbase':
-                    total += tx.get('recompensa', 0)
-        return total
+        """Supply total en la punta (contador acumulado, sin recorrer la cadena)"""
+        return self.supply.total()[0]
+
+    def get_total_fees(self):
+        """Fees acumulados de todas las coinbase hasta la punta"""
+        return self.supply.total()[1]
+
+    def get_supply_at(self, height):
+        """Supply y fees acumulados hasta la altura `height` incluida"""
+        total_supply, total_fees = self.supply.at(height)
+        return {
+            'height': height,
+            'total_supply': total_supply,
+            'total_fees': total_fees
+        }
 
     def discover_peers_from_server(self, server_url="https://rudagserver.canariannode.uk"):
         """Descubrir peers desde el servidor central via Cloudflare"""
@@ -441,7 +809,6 @@ class Blockchain:
                         added_count += 1
                 
                 print(f"✅ {added_count} nuevos peers añadidos a la red local")
-                self.save_blockchain()
                 return True
                 
         except requests.exceptions.ConnectionError:
@@ -0,0 +1,164 @@
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from core import hash_bloque
+from mempool import transaction_id
+
+INV_BLOCK = 'block'
+INV_TX = 'tx'
+
+
+def message_digest(message):
+    """Digest del contenido de un mensaje de red (tipo + datos), sin emisor ni
+    timestamp, para reconocer el mismo mensaje llegado por distintos peers"""
+    content = json.dumps({'type': message.get('type'), 'data': message.get('data')}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def inventory_id(kind, payload):
+    """Identificador de inventario de un bloque o una transacción"""
+    return hash_bloque(payload) if kind == INV_BLOCK else transaction_id(payload)
+
+
+class BoundedSet:
+    """Conjunto con tamaño máximo que olvida primero lo más antiguo"""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._items = OrderedDict()
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        self._items[item] = None
+        self._items.move_to_end(item)
+        if len(self._items) > self.maxlen:
+            self._items.popitem(last=False)
+
+
+class SeenCache:
+    """Caché LRU con caducidad de los mensajes ya procesados.
+
+    Guarda como mucho `max_entries` digests y cada uno caduca a los `ttl`
+    segundos de la última vez que se vio, así que la memoria queda acotada
+    y un mensaje que sigue circulando en bucle no vuelve a procesarse.
+    """
+
+    def __init__(self, max_entries=20000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._seen = OrderedDict()  # digest -> última vez visto
+        self._lock = Lock()
+        self.received = 0
+        self.duplicates = 0
+
+    def check_and_add(self, digest):
+        """True si el digest ya se vio (duplicado); si no, lo registra"""
+        now = time.time()
+        with self._lock:
+            self.received += 1
+            # Los más antiguos van al principio: caducar desde ahí
+            while self._seen and next(iter(self._seen.values())) < now - self.ttl:
+                self._seen.popitem(last=False)
+
+            duplicate = digest in self._seen
+            self._seen[digest] = now
+            self._seen.move_to_end(digest)
+            if duplicate:
+                self.duplicates += 1
+            elif len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return duplicate
+
+    def discard(self, digest):
+        """Olvidar un digest (mensaje que no se llegó a procesar)"""
+        with self._lock:
+            self._seen.pop(digest, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._seen),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'received': self.received,
+                'duplicates': self.duplicates,
+                'duplicate_rate': self.duplicates / self.received if self.received else 0
+            }
+
+
+class Inventory:
+    """Inventario para el gossip inv/getdata.
+
+    Guarda los payloads recientes (bloques y transacciones) por su id para
+    servirlos cuando un peer los pide, y por cada peer un conjunto acotado
+    con los ids que ya sabemos que tiene (nos los anunció, nos los envió o
+    se los enviamos), para no volver a anunciárselos.
+    """
+
+    def __init__(self, max_items=10000, known_per_peer=5000):
+        self.max_items = max_items
+        self.known_per_peer = known_per_peer
+        self._payloads = OrderedDict()  # id -> (tipo, payload)
+        self._known = {}  # peer -> BoundedSet de ids
+        self._lock = Lock()
+
+    def add(self, kind, payload, item_id=None):
+        """Registrar un payload propio o recibido; devuelve su id"""
+        item_id = item_id or inventory_id(kind, payload)
+        with self._lock:
+            self._payloads[item_id] = (kind, payload)
+            self._payloads.move_to_end(item_id)
+            if len(self._payloads) > self.max_items:
+                self._payloads.popitem(last=False)
+        return item_id
+
+    def has(self, item_id):
+        with self._lock:
+            return item_id in self._payloads
+
+    def discard(self, item_id):
+        """Quitar un payload recibido que no llegó a aceptarse"""
+        with self._lock:
+            self._payloads.pop(item_id, None)
+
+    def get(self, item_id):
+        """(tipo, payload) de un id, o None si ya no está en el inventario"""
+        with self._lock:
+            return self._payloads.get(item_id)
+
+    def mark_known(self, peer, item_ids):
+        """Anotar que el peer ya tiene esos ids"""
+        with self._lock:
+            known = self._known.get(peer)
+            if known is None:
+                known = self._known[peer] = BoundedSet(self.known_per_peer)
+            for item_id in item_ids:
+                known.add(item_id)
+
+    def unknown_to(self, peer, items):
+        """Los items {'type', 'id'} que el peer aún no tiene, según lo que sabemos"""
+        with self._lock:
+            known = self._known.get(peer)
+            if known is None:
+                return list(items)
+            return [item for item in items if item['id'] not in known]
+
+    def forget_peer(self, peer):
+        with self._lock:
+            self._known.pop(peer, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._payloads),
+                'max_items': self.max_items,
+                'known_per_peer': {peer: len(known) for peer, known in self._known.items()}
+            }
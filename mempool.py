@@ -0,0 +1,219 @@
+import json
+import time
+import heapq
+import hashlib
+from collections import OrderedDict
+from threading import RLock
+
+# Ids expulsados o caducados que se recuerdan para rechazar su reenvío
+MAX_REJECTED_IDS = 100000
+
+
+def transaction_id(tx):
+    """Identificador de una transacción: hash de su contenido (sin el campo 'hash')"""
+    content = {key: value for key, value in tx.items() if key != 'hash'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+class MempoolRejected(Exception):
+    """La transacción no entra en la mempool (expulsada, caducada o fee insuficiente)"""
+
+
+class Mempool:
+    """Transacciones pendientes indexadas por su id de contenido.
+
+    Un OrderedDict id -> transacción da alta, consulta y baja en O(1)
+    conservando el orden de llegada. Un heap (-fee, orden de llegada, id)
+    ordena por fee: las bajas no lo tocan, sus entradas se descartan al
+    recorrerlo (borrado perezoso) y se compacta cuando las entradas muertas
+    superan a las vivas. Confirmar un bloque quita sus transacciones en
+    O(transacciones del bloque).
+
+    El tamaño está acotado por número (`max_count`) y bytes (`max_bytes`)
+    de transacciones: al pasarse se expulsan las de menor fee por byte,
+    con un segundo heap mínimo. Cada transacción caduca `ttl` segundos
+    después de su timestamp. Los ids expulsados o caducados se recuerdan
+    y se rechaza volver a admitirlos cuando un peer los reenvía.
+    """
+
+    def __init__(self, lock=None, max_count=50000, max_bytes=32 * 1024 * 1024, ttl=72 * 3600):
+        self.lock = lock or RLock()
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._txs = OrderedDict()
+        self._meta = {}  # id -> (orden de llegada, bytes, caducidad)
+        self._heap = []  # (-fee, orden, id): las de mayor fee primero
+        self._rate_heap = []  # (fee por byte, orden, id): la peor primero
+        self._expiry_heap = []  # (caducidad, orden, id)
+        self._rejected = OrderedDict()
+        self._seq = 0
+        self.bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._txs)
+
+    def __contains__(self, tx_id):
+        return tx_id in self._txs
+
+    def __iter__(self):
+        """Transacciones en orden de llegada"""
+        with self.lock:
+            return iter(list(self._txs.values()))
+
+    def get(self, tx_id):
+        return self._txs.get(tx_id)
+
+    def was_rejected(self, tx_id):
+        """True si el id se expulsó o caducó (no se vuelve a admitir)"""
+        return tx_id in self._rejected
+
+    def _live(self, entry):
+        """Si una entrada de heap sigue correspondiendo a una transacción presente"""
+        meta = self._meta.get(entry[2])
+        return meta is not None and meta[0] == entry[1]
+
+    def add(self, tx):
+        """Añadir una transacción; devuelve su id, o None si ya estaba.
+
+        Lanza MempoolRejected si el id se expulsó o caducó antes, o si ya
+        está caducada. No aplica los límites de tamaño: ver enforce_limits().
+        """
+        tx_id = transaction_id(tx)
+        now = time.time()
+        with self.lock:
+            if tx_id in self._txs:
+                return None
+            if tx_id in self._rejected:
+                self.rejected += 1
+                raise MempoolRejected(f"Transacción {tx_id[:16]}... expulsada o caducada")
+            # Un timestamp futuro no alarga la vida de la transacción
+            expires_at = min(tx.get('timestamp', now), now) + self.ttl
+            if expires_at <= now:
+                self.rejected += 1
+                raise MempoolRejected(f"Transacción {tx_id[:16]}... caducada")
+
+            tx['hash'] = tx_id
+            size = len(json.dumps(tx, separators=(',', ':')))
+            seq = self._seq
+            self._seq += 1
+            self._txs[tx_id] = tx
+            self._meta[tx_id] = (seq, size, expires_at)
+            self.bytes += size
+            fee = tx.get('fee', 0)
+            heapq.heappush(self._heap, (-fee, seq, tx_id))
+            heapq.heappush(self._rate_heap, (fee / size, seq, tx_id))
+            heapq.heappush(self._expiry_heap, (expires_at, seq, tx_id))
+        return tx_id
+
+    def load(self, transactions):
+        """Reemplazar el contenido (al arrancar); recalcula los ids"""
+        with self.lock:
+            self.clear()
+            for tx in transactions:
+                try:
+                    self.add(tx)
+                except MempoolRejected:
+                    self.expired += 1
+
+    def remove(self, tx_id):
+        """Quitar una transacción por id; devuelve la transacción o None"""
+        with self.lock:
+            tx = self._txs.pop(tx_id, None)
+            if tx is None:
+                return None
+            self.bytes -= self._meta.pop(tx_id)[1]
+            # Compactar los heaps si la mayoría de sus entradas ya están muertas
+            if len(self._heap) > 2 * len(self._txs) + 64:
+                self._heap = [entry for entry in self._heap if self._live(entry)]
+                self._rate_heap = [entry for entry in self._rate_heap if self._live(entry)]
+                self._expiry_heap = [entry for entry in self._expiry_heap if self._live(entry)]
+                for heap in (self._heap, self._rate_heap, self._expiry_heap):
+                    heapq.heapify(heap)
+            return tx
+
+    def remove_confirmed(self, transactions):
+        """Quitar las transacciones incluidas en un bloque; devuelve los ids quitados"""
+        removed = []
+        with self.lock:
+            for tx in transactions:
+                if tx.get('tipo') == 'coinbase':
+                    continue
+                tx_id = transaction_id(tx)
+                if self.remove(tx_id) is not None:
+                    removed.append(tx_id)
+        return removed
+
+    def _reject(self, tx_id):
+        """Quitar una transacción y recordar su id para no readmitirla"""
+        self.remove(tx_id)
+        self._rejected[tx_id] = None
+        if len(self._rejected) > MAX_REJECTED_IDS:
+            self._rejected.popitem(last=False)
+
+    def enforce_limits(self):
+        """Quitar las caducadas y, si se supera algún límite, las de menor fee
+        por byte; devuelve los ids quitados"""
+        removed = []
+        now = time.time()
+        with self.lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                entry = heapq.heappop(self._expiry_heap)
+                if self._live(entry):
+                    self._reject(entry[2])
+                    self.expired += 1
+                    removed.append(entry[2])
+
+            while self._txs and (len(self._txs) > self.max_count or self.bytes > self.max_bytes):
+                entry = heapq.heappop(self._rate_heap)
+                if self._live(entry):
+                    self._reject(entry[2])
+                    self.evicted += 1
+                    removed.append(entry[2])
+        return removed
+
+    def top(self, k):
+        """Las `k` transacciones de mayor fee, en orden, sin modificar el heap.
+
+        Recorre el array del heap como árbol con una frontera ordenada: la
+        raíz es la mejor entrada y los hijos de cada entrada extraída son los
+        siguientes candidatos. Cuesta O(k log k) más las entradas muertas
+        que se crucen, en lugar de ordenar toda la mempool.
+        """
+        selected = []
+        with self.lock:
+            heap = self._heap
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and len(selected) < k:
+                entry, index = heapq.heappop(frontier)
+                if self._live(entry):
+                    selected.append(self._txs[entry[2]])
+                for child in (2 * index + 1, 2 * index + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+        return selected
+
+    def clear(self):
+        with self.lock:
+            self._txs.clear()
+            self._meta.clear()
+            self._heap = []
+            self._rate_heap = []
+            self._expiry_heap = []
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'transactions': len(self._txs),
+                'bytes': self.bytes,
+                'max_transactions': self.max_count,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'evicted': self.evicted,
+                'expired': self.expired,
+                'rejected': self.rejected
+            }
@@ -0,0 +1,260 @@
+import os
+import time
+import multiprocessing as mp
+from queue import Empty
+from threading import Thread, Event
+
+from core import MidstateHasher, Bloque, RGDBlockchainConfig
+
+# Nonces consecutivos que cada worker prueba antes de mirar la señal de parada
+TAMANO_RANGO = 2000
+# Cada cuánto (segundos) se revisa la señal de cancelación mientras se mina
+INTERVALO_CANCELACION = 0.01
+
+
+def _buscar_nonce(bloque, dificultad, worker_id, total_workers, encontrado, resultados, contador):
+    """Proceso worker: recorre los rangos de nonces que le corresponden.
+
+    El espacio de nonces se parte en rangos de TAMANO_RANGO; el worker N
+    prueba los rangos N, N + total_workers, N + 2*total_workers, ...
+    """
+    hasher = MidstateHasher(bloque)
+    rango = worker_id
+
+    while not encontrado.is_set():
+        inicio = rango * TAMANO_RANGO
+        for nonce in range(inicio, inicio + TAMANO_RANGO):
+            if hasher.cumple(nonce, dificultad):
+                encontrado.set()
+                resultados.put(nonce)
+                break
+
+        with contador.get_lock():
+            contador.value += nonce - inicio + 1
+        rango += total_workers
+
+
+class ParallelMiner:
+    """Motor de minado multi-núcleo con particionado del espacio de nonces"""
+
+    def __init__(self, blockchain, workers=RGDBlockchainConfig.MINING_WORKERS):
+        self.blockchain = blockchain
+        self.workers = workers or os.cpu_count() or 1
+        self._contador = None
+        self._inicio = None
+        self.ultimo_hashrate = 0
+        self.total_nonces = 0
+
+    def minar(self, indice, hash_anterior, transacciones, tiempo, cancelar=None):
+        """Buscar un nonce válido usando todos los workers.
+
+        El primer worker que encuentra solución avisa al resto para que
+        paren. Devuelve un Bloque listo para nuevo_bloque(), o None si se
+        activa el evento `cancelar` antes de encontrarlo.
+        """
+        bloque = Bloque(indice, hash_anterior, transacciones, tiempo, 0)
+
+        encontrado = mp.Event()
+        resultados = mp.Queue()
+        self._contador = mp.Value('Q', 0)
+        self._inicio = time.time()
+
+        procesos = [
+            mp.Process(
+                target=_buscar_nonce,
+                args=(bloque.__dict__, self.blockchain.dificultad, worker_id,
+                      self.workers, encontrado, resultados, self._contador),
+                daemon=True
+            )
+            for worker_id in range(self.workers)
+        ]
+        for proceso in procesos:
+            proceso.start()
+
+        try:
+            while True:
+                try:
+                    bloque.nonce = resultados.get(timeout=INTERVALO_CANCELACION)
+                    break
+                except Empty:
+                    if cancelar is not None and cancelar.is_set():
+                        self.total_nonces += self._contador.value
+                        self._contador = None
+                        return None
+                    if not any(p.is_alive() for p in procesos):
+                        raise Exception("Los workers de minado terminaron sin solución")
+        finally:
+            encontrado.set()
+            for proceso in procesos:
+                proceso.join(timeout=1)
+                if proceso.is_alive():
+                    proceso.terminate()
+
+        stats = self.estadisticas()
+        self.ultimo_hashrate = stats['hashrate']
+        self.total_nonces += stats['nonces']
+        self._contador = None
+        print(f"⛏️  Bloque {indice} minado: nonce {bloque.nonce} | "
+              f"{stats['nonces']} nonces | {stats['hashrate']:.0f} H/s con {self.workers} workers")
+        return bloque
+
+    def estadisticas(self):
+        """Nonces probados y hashrate agregado de la búsqueda actual"""
+        if self._contador is None:
+            return {'workers': self.workers, 'nonces': 0, 'hashrate': self.ultimo_hashrate}
+
+        nonces = self._contador.value
+        elapsed = max(time.time() - self._inicio, 1e-9)
+        return {
+            'workers': self.workers,
+            'nonces': nonces,
+            'hashrate': nonces / elapsed
+        }
+
+
+class SenalPuntaCambiada:
+    """Señal de cancelación para minar(): se activa si la punta de la cadena
+    cambia respecto a `tip_version` o si se pide detener el minado"""
+
+    def __init__(self, blockchain, tip_version, detener=None):
+        self.blockchain = blockchain
+        self.tip_version = tip_version
+        self.detener = detener
+
+    def punta_cambiada(self):
+        return self.blockchain.tip_version != self.tip_version
+
+    def is_set(self):
+        if self.detener is not None and self.detener.is_set():
+            return True
+        return self.punta_cambiada()
+
+
+class MiningJob:
+    """Minado continuo en segundo plano, fuera del ciclo de las peticiones HTTP"""
+
+    def __init__(self, blockchain, network_manager, miner):
+        self.blockchain = blockchain
+        self.network_manager = network_manager
+        self.miner = miner
+        self.mining_wallet = None
+        self.running = False
+        self._detener = Event()
+        self._thread = None
+        self.current_height = None
+        self.blocks_found = 0
+        self.started_at = None
+        self.last_block = None
+        self.last_error = None
+        # Búsquedas reiniciadas porque llegó un bloque que cambió la punta
+        self.stale_restarts = 0
+
+    def start(self, mining_wallet):
+        """Arrancar el minado continuo hacia `mining_wallet`"""
+        if self.running:
+            return False
+
+        self.mining_wallet = mining_wallet
+        self.running = True
+        self.blocks_found = 0
+        self.last_error = None
+        self._detener.clear()
+        self.started_at = time.time()
+        self._thread = Thread(target=self._mining_worker, daemon=True)
+        self._thread.start()
+        print(f"⛏️  Minado en segundo plano iniciado para {mining_wallet}")
+        return True
+
+    def stop(self):
+        """Detener el minado; aborta la búsqueda de nonce en curso"""
+        if not self.running:
+            return False
+
+        self.running = False
+        self._detener.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.current_height = None
+        print("🛑 Minado en segundo plano detenido")
+        return True
+
+    def mine_block(self, mining_wallet, detener=None):
+        """Minar un bloque sobre la punta actual y añadirlo a la cadena.
+
+        Si otro bloque cambia la punta durante la búsqueda, el trabajo en curso
+        se aborta y se vuelve a empezar sobre la nueva punta. Devuelve
+        (bloque, template), o (None, None) si se activa `detener`.
+        """
+        while True:
+            with self.blockchain.lock:
+                template = self.blockchain.create_block_template(mining_wallet)
+                senal = SenalPuntaCambiada(self.blockchain, self.blockchain.tip_version, detener)
+            self.current_height = template['indice']
+
+            block = self.miner.minar(
+                template['indice'],
+                template['hash_anterior'],
+                template['transacciones'],
+                time.time(),
+                cancelar=senal
+            )
+
+            if block is not None:
+                with self.blockchain.lock:
+                    if not senal.punta_cambiada():
+                        self.blockchain.nuevo_bloque(block)
+                        return block, template
+
+            if detener is not None and detener.is_set():
+                return None, None
+
+            self.stale_restarts += 1
+            print(f"🔄 La punta cambió durante el minado del bloque {template['indice']}, reiniciando")
+
+    def _mining_worker(self):
+        """Trabajador que mina bloques uno tras otro hasta que se detenga"""
+        while self.running:
+            try:
+                block, template = self.mine_block(self.mining_wallet, detener=self._detener)
+                if block is None:
+                    continue
+
+                self.blocks_found += 1
+                self.last_block = {
+                    'index': block.indice,
+                    'nonce': block.nonce,
+                    'recompensa': template['recompensa'],
+                    'fees': template['fees'],
+                    'transacciones': len(block.transacciones),
+                    'tiempo': block.tiempo
+                }
+                self.network_manager.broadcast_new_block(block.__dict__)
+
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Error en minado en segundo plano: {e}")
+                self._detener.wait(5)
+
+    def status(self):
+        """Estado del trabajo de minado: altura, nonces, hashrate y ETA"""
+        stats = self.miner.estadisticas()
+        hashrate = stats['hashrate']
+        # Número esperado de intentos para cumplir la dificultad (prefijo hex)
+        expected_hashes = 16 ** len(self.blockchain.dificultad)
+
+        return {
+            'running': self.running,
+            'mining_wallet': self.mining_wallet,
+            'current_height': self.current_height,
+            'nonces_tried': stats['nonces'],
+            'total_nonces': self.miner.total_nonces + stats['nonces'],
+            'hashrate': hashrate,
+            'eta_seconds': expected_hashes / hashrate if hashrate else None,
+            'workers': stats['workers'],
+            'difficulty': self.blockchain.dificultad,
+            'blocks_found': self.blocks_found,
+            'stale_restarts': self.stale_restarts,
+            'last_block': self.last_block,
+            'started_at': self.started_at,
+            'last_error': self.last_error
+        }
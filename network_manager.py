@@ -1,15 +1,43 @@
-import requests
 import time
-import json
-from threading import Thread
+from threading import Thread, Condition
 from queue import Queue
-import hashlib
+from core import Bloque, hash_bloque, RGDBlockchainConfig
+from broadcaster import Broadcaster
+from inventory import Inventory, SeenCache, INV_BLOCK, INV_TX, inventory_id, message_digest
+
+# Versión del gossip que anuncia cada nodo en sus respuestas a /network/receive:
+# los nodos anteriores no la envían (1 = solo mensajes completos, uno a uno);
+# desde la 2 entienden inv/getdata y transactions_batch
+GOSSIP_PROTOCOL = 2
+
+# Mensajes de gossip cuyo contenido es el mismo venga del peer que venga:
+# un duplicado se descarta antes de validarlo o reenviarlo
+DEDUP_MESSAGE_TYPES = {'new_block', 'new_transaction', 'transactions_batch', 'new_peer', 'peers_list'}
 
 class NetworkManager:
     def __init__(self, blockchain, wallet_manager):
         self.blockchain = blockchain
         self.wallet_manager = wallet_manager
         self.message_queue = Queue()
+        # Bloques y transacciones se anuncian por id (inv) y cada peer pide
+        # solo lo que no tiene (getdata)
+        self.inventory = Inventory(RGDBlockchainConfig.INVENTORY_MAX_ITEMS,
+                                   RGDBlockchainConfig.INVENTORY_KNOWN_PER_PEER)
+        self.seen_messages = SeenCache(RGDBlockchainConfig.SEEN_CACHE_SIZE,
+                                       RGDBlockchainConfig.SEEN_CACHE_TTL)
+        # node_id -> dirección, aprendido de las respuestas de cada peer
+        self.peer_ids = {}
+        # Cola y trabajador de envío por peer
+        self.broadcaster = Broadcaster(blockchain.peer_client,
+                                       RGDBlockchainConfig.BROADCAST_QUEUE_SIZE,
+                                       prepare=self._prepare_message,
+                                       on_response=self._handle_send_response)
+        # Transacciones salientes agrupadas en lotes (ver _tx_relay_worker)
+        self.tx_relay_window = RGDBlockchainConfig.TX_RELAY_WINDOW_MS / 1000
+        self.tx_relay_max_batch = RGDBlockchainConfig.TX_RELAY_MAX_BATCH
+        self._tx_relay = []
+        self._tx_relay_started = 0
+        self._tx_relay_cond = Condition()
         self.running = True
         self.broadcast_delay = 2  # segundos entre broadcasts
         self.peer_discovery_enabled = True
@@ -17,10 +45,12 @@ class NetworkManager:
     def start_network_services(self):
         """Iniciar servicios de red en segundo plano"""
         self.broadcast_thread = Thread(target=self._broadcast_worker, daemon=True)
+        self.tx_relay_thread = Thread(target=self._tx_relay_worker, daemon=True)
         self.sync_thread = Thread(target=self._sync_worker, daemon=True)
         self.peer_discovery_thread = Thread(target=self._peer_discovery_worker, daemon=True)
         
         self.broadcast_thread.start()
+        self.tx_relay_thread.start()
         self.sync_thread.start()
         self.peer_discovery_thread.start()
         
@@ -29,19 +59,121 @@ class NetworkManager:
     def stop_network_services(self):
         """Detener servicios de red"""
         self.running = False
+        with self._tx_relay_cond:
+            self._tx_relay_cond.notify()
+        self.message_queue.put(None)  # despertar al broadcast worker
+        self.broadcaster.stop()
         print("🛑 Servicios de red detenidos")
     
     def _broadcast_worker(self):
-        """Trabajador para broadcast de mensajes"""
+        """Trabajador para broadcast de mensajes: despierta con cada mensaje nuevo"""
         while self.running:
             try:
-                if not self.message_queue.empty():
-                    message = self.message_queue.get()
-                    self._broadcast_message(message)
-                time.sleep(0.1)
+                message = self.message_queue.get()
+                if message is None:
+                    break
+                self._broadcast_message(message)
             except Exception as e:
                 print(f"❌ Error en broadcast worker: {e}")
     
+    def _tx_relay_worker(self):
+        """Trabajador que agrupa las transacciones salientes en lotes.
+
+        El lote se cierra `tx_relay_window` segundos después de su primera
+        transacción o al llegar a `tx_relay_max_batch`, y sale como un único
+        inv por peer.
+        """
+        while self.running:
+            try:
+                with self._tx_relay_cond:
+                    while self.running and not self._tx_relay:
+                        self._tx_relay_cond.wait()
+                    deadline = self._tx_relay_started + self.tx_relay_window
+                    while self.running and len(self._tx_relay) < self.tx_relay_max_batch:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._tx_relay_cond.wait(remaining)
+
+                    batch = self._tx_relay[:self.tx_relay_max_batch]
+                    self._tx_relay = self._tx_relay[self.tx_relay_max_batch:]
+                    self._tx_relay_started = time.time()
+
+                if batch:
+                    self._queue_transactions(batch)
+            except Exception as e:
+                print(f"❌ Error en tx relay worker: {e}")
+
+    def _queue_transactions(self, transactions):
+        """Anunciar un lote de transacciones a la red"""
+        self._announce([{'type': INV_TX, 'id': self.inventory.add(INV_TX, tx)}
+                        for tx in transactions])
+        print(f"📤 Transmitiendo {len(transactions)} transacciones a la red")
+
+    def _announce(self, items):
+        """Encolar un inv con los ids de bloques/transacciones del inventario"""
+        self.message_queue.put({
+            'type': 'inv',
+            'data': {'items': items},
+            'timestamp': time.time(),
+            'node_id': getattr(self.blockchain, 'node_id', 'unknown')
+        })
+
+    def _payload_messages(self, item_ids, batch=True):
+        """Mensajes con los payloads de esos ids: un new_block por bloque y las
+        transacciones juntas en un transactions_batch (o una new_transaction
+        por transacción con `batch=False`, para peers que no conocen los lotes)"""
+        node_id = getattr(self.blockchain, 'node_id', 'unknown')
+        messages, transactions = [], []
+        for item_id in item_ids:
+            entry = self.inventory.get(item_id)
+            if entry is None:
+                continue
+            kind, payload = entry
+            if kind == INV_BLOCK:
+                messages.append({'type': 'new_block', 'data': payload,
+                                 'timestamp': time.time(), 'node_id': node_id})
+            else:
+                transactions.append(payload)
+        if len(transactions) == 1 or not batch:
+            for transaction in transactions:
+                messages.append({'type': 'new_transaction', 'data': transaction,
+                                 'timestamp': time.time(), 'node_id': node_id})
+        elif transactions:
+            messages.append({'type': 'transactions_batch', 'data': {'transactions': transactions},
+                             'timestamp': time.time(), 'node_id': node_id})
+        return messages
+
+    def _prepare_message(self, node, message):
+        """Quitar del inv lo que el peer ya tiene; None si no queda nada"""
+        if message['type'] != 'inv':
+            return message
+        items = self.inventory.unknown_to(node, message['data']['items'])
+        if not items:
+            return None
+        return {**message, 'data': {'items': items}}
+
+    def _handle_send_response(self, node, message, response):
+        """Tras un inv aceptado, enviar al peer los payloads que pidió (getdata)"""
+        try:
+            reply = response.json()
+        except ValueError:
+            reply = {}
+        if reply.get('node_id'):
+            self.peer_ids[reply['node_id']] = node
+        if message['type'] != 'inv':
+            return
+
+        item_ids = [item['id'] for item in message['data']['items']]
+        self.inventory.mark_known(node, item_ids)
+        # Un peer sin soporte de inv se reconoce porque no anuncia versión de
+        # gossip: se le envía todo, transacción a transacción (tampoco
+        # entiende transactions_batch). Uno actual pide lo que le falte.
+        legacy = reply.get('protocol', 1) < GOSSIP_PROTOCOL
+        wanted = item_ids if legacy else reply.get('getdata', [])
+        for payload_message in self._payload_messages(wanted, batch=not legacy):
+            self.blockchain.peer_client.post(node, '/network/receive', json=payload_message)
+
     def _sync_worker(self):
         """Trabajador para sincronización periódica"""
         sync_interval = 30  # sincronizar cada 30 segundos
@@ -98,81 +230,103 @@ class NetworkManager:
                 print(f"❌ Error compartiendo peers con {node}: {e}")
     
     def broadcast_new_block(self, block_data):
-        """Transmitir nuevo bloque a la red"""
-        message = {
-            'type': 'new_block',
-            'data': block_data,
-            'timestamp': time.time(),
-            'node_id': getattr(self.blockchain, 'node_id', 'unknown')
-        }
-        self.message_queue.put(message)
+        """Transmitir nuevo bloque a la red (se anuncia su hash con un inv)"""
+        self._announce([{'type': INV_BLOCK, 'id': self.inventory.add(INV_BLOCK, block_data)}])
         print(f"📤 Transmitiendo bloque {block_data['indice']} a la red")
     
     def broadcast_new_transaction(self, transaction_data):
-        """Transmitir nueva transacción a la red"""
-        message = {
-            'type': 'new_transaction',
-            'data': transaction_data,
-            'timestamp': time.time(),
-            'node_id': getattr(self.blockchain, 'node_id', 'unknown')
-        }
-        self.message_queue.put(message)
-        print(f"📤 Transmitiendo transacción a la red")
+        """Transmitir nueva transacción a la red (en el próximo lote)"""
+        self._relay_transactions([transaction_data])
+
+    def _relay_transactions(self, transactions):
+        """Añadir transacciones, propias o recibidas, al próximo lote de salida"""
+        with self._tx_relay_cond:
+            if not self._tx_relay:
+                self._tx_relay_started = time.time()
+            self._tx_relay.extend(transactions)
+            self._tx_relay_cond.notify()
     
     def _broadcast_message(self, message):
-        """Transmitir mensaje a todos los nodos"""
-        for node in list(self.blockchain.nodes):
-            try:
-                # Intentar tanto HTTP como HTTPS
-                protocols = ['https', 'http']
-                success = False
-                
-                for protocol in protocols:
-                    try:
-                        url = f"{protocol}://{node}/network/receive"
-                        response = requests.post(
-                            url,
-                            json=message,
-                            timeout=5
-                        )
-                        if response.status_code == 200:
-                            print(f"✅ Mensaje {message['type']} transmitido a {node} ({protocol})")
-                            success = True
-                            break
-                    except Exception as e:
-                        continue
-                
-                if not success:
-                    print(f"❌ No se pudo transmitir a {node} con ningún protocolo")
-                    
-            except Exception as e:
-                print(f"❌ Error en broadcast a {node}: {e}")
+        """Transmitir mensaje a todos los nodos (en paralelo, una cola por peer)"""
+        # Copia bajo el lock: otros hilos añaden peers mientras se difunde
+        with self.blockchain.lock:
+            nodes = list(self.blockchain.nodes)
+        self.broadcaster.broadcast(message, nodes)
     
     def receive_message(self, message):
-        """Procesar mensaje recibido de la red"""
+        """Procesar mensaje recibido de la red; devuelve la respuesta para el
+        emisor (getdata de un inv) o None"""
+        digest = None
         try:
             msg_type = message.get('type')
             data = message.get('data')
             sender = message.get('node_id')
+
+            # El digest se registra ya para descartar las copias que lleguen
+            # mientras se procesa, y se retira si el mensaje no se procesa bien:
+            # una copia posterior (o un reenvío) tendrá otra oportunidad
+            digest = message_digest(message) if msg_type in DEDUP_MESSAGE_TYPES else None
+            if digest and self.seen_messages.check_and_add(digest):
+                print(f"⏭️  Mensaje {msg_type} de {sender} ya procesado, ignorando")
+                return None
             
             print(f"📥 Mensaje recibido de {sender}: {msg_type}")
             
-            if msg_type == 'new_block':
-                self._process_received_block(data, sender)
+            processed = True
+            if msg_type == 'inv':
+                return self._process_inv(data, sender)
+            elif msg_type == 'new_block':
+                processed = self._process_received_block(data, sender)
             elif msg_type == 'new_transaction':
-                self._process_received_transaction(data, sender)
+                processed = self._process_received_transaction(data, sender)
+            elif msg_type == 'transactions_batch':
+                processed = self._process_received_transactions_batch(data, sender)
             elif msg_type == 'chain_request':
                 self._handle_chain_request(sender)
             elif msg_type == 'chain_response':
                 self._handle_chain_response(data, sender)
             elif msg_type == 'new_peer':
-                self._process_new_peer(data, sender)
+                processed = self._process_new_peer(data, sender)
             elif msg_type == 'peers_list':
-                self._process_peers_list(data, sender)
+                processed = self._process_peers_list(data, sender)
+
+            if digest and not processed:
+                self.seen_messages.discard(digest)
                 
         except Exception as e:
             print(f"❌ Error procesando mensaje: {e}")
+            if digest:
+                self.seen_messages.discard(digest)
     
+    def _process_inv(self, inv_data, sender):
+        """Responder a un inv con los ids que no tenemos (getdata)"""
+        items = inv_data.get('items', [])
+        peer = self.peer_ids.get(sender)
+        if peer:
+            self.inventory.mark_known(peer, [item['id'] for item in items])
+        wanted = [item['id'] for item in items if not self._have_item(item)]
+        if wanted:
+            print(f"📥 inv de {sender}: pidiendo {len(wanted)} de {len(items)}")
+        return {'getdata': wanted}
+
+    def _have_item(self, item):
+        if self.inventory.has(item['id']):
+            return True
+        if item['type'] == INV_TX:
+            # Lo expulsado o caducado no se vuelve a pedir
+            return item['id'] in self.blockchain.mempool or self.blockchain.mempool.was_rejected(item['id'])
+        return self.blockchain.store.height_of(item['id']) is not None
+
+    def _register_received(self, kind, payload, sender):
+        """Guardar un payload recibido en el inventario; devuelve (id, ya lo teníamos)"""
+        item_id = inventory_id(kind, payload)
+        known = self._have_item({'type': kind, 'id': item_id})
+        self.inventory.add(kind, payload, item_id)
+        peer = self.peer_ids.get(sender)
+        if peer:
+            self.inventory.mark_known(peer, [item_id])
+        return item_id, known
+
     def _process_new_peer(self, peer_data, sender):
         """Procesar nuevo peer recibido de otro nodo"""
         try:
@@ -183,9 +337,11 @@ class NetworkManager:
                 
                 # Compartir nuestro conocimiento de peers con el nuevo nodo
                 self.blockchain.share_peers_list(new_node)
+            return True
                 
         except Exception as e:
             print(f"❌ Error procesando nuevo peer: {e}")
+            return False
     
     def _process_peers_list(self, peers_data, sender):
         """Procesar lista de peers recibida"""
@@ -200,146 +356,149 @@ class NetworkManager:
             
             if new_peers_added > 0:
                 print(f"👥 {new_peers_added} nuevos peers añadidos desde {sender}")
+            return True
                 
         except Exception as e:
             print(f"❌ Error procesando lista de peers: {e}")
+            return False
     
     def _process_received_block(self, block_data, sender):
-        """Procesar bloque recibido de otro nodo"""
+        """Procesar bloque recibido de otro nodo; False si no se pudo procesar"""
         try:
-            # Verificar si ya tenemos este bloque
+            block_hash, _ = self._register_received(INV_BLOCK, block_data, sender)
+
+            # Verificar si ya tenemos este bloque (los índices empiezan en 0)
             current_chain_length = len(self.blockchain.chain)
-            if block_data['indice'] <= current_chain_length:
+            if block_data['indice'] < current_chain_length:
                 print(f"⏭️  Bloque {block_data['indice']} ya existe, ignorando")
-                return
+                return True
             
             # Verificar si es el siguiente bloque esperado
-            if block_data['indice'] == current_chain_length + 1:
+            if block_data['indice'] == current_chain_length:
                 print(f"✅ Recibido siguiente bloque {block_data['indice']}")
-                self._validate_and_add_block(block_data)
+                if not self._validate_and_add_block(block_data, block_hash):
+                    return False
+                # Anunciarlo a los peers que aún no lo tienen
+                self._announce([{'type': INV_BLOCK, 'id': block_hash}])
             else:
-                # Necesitamos sincronizar la cadena completa
+                # Nos faltan bloques: sincronizar solo desde el último común
                 print(f"🔄 Bloque {block_data['indice']} recibido, necesitamos sincronizar")
-                self.request_full_chain(sender)
+                Thread(target=self.sync_blockchain, daemon=True).start()
+            return True
                 
         except Exception as e:
             print(f"❌ Error procesando bloque recibido: {e}")
+            return False
     
-    def _validate_and_add_block(self, block_data):
+    def _validate_and_add_block(self, block_data, block_hash=None):
         """Validar y agregar bloque a la cadena"""
         try:
-            # Verificar Proof of Work
-            if not self.blockchain.validar_pow(block_data):
-                print("❌ Bloque con PoW inválido")
-                return False
-            
-            # Verificar hash anterior
-            last_block = self.blockchain.last_block
-            if block_data['hash_anterior'] != self._calculate_block_hash(last_block):
-                print("❌ Hash anterior no coincide")
-                return False
-            
             # Crear objeto bloque
-            block = self.blockchain.Bloque(
+            block = Bloque(
                 block_data['indice'],
                 block_data['hash_anterior'],
                 block_data['transacciones'],
                 block_data['tiempo'],
                 block_data['nonce']
             )
-            
-            # Agregar bloque
-            self.blockchain.nuevo_bloque(block)
+
+            # Solo se guardan los campos de Bloque: con claves extra el hash
+            # recibido no sería el del bloque almacenado
+            if set(block_data) != set(block.__dict__):
+                print("❌ Bloque con campos inesperados")
+                return False
+
+            # Verificar Proof of Work (el hash se reutiliza al guardar el bloque)
+            block_hash = block_hash or hash_bloque(block.__dict__)
+            if not self.blockchain.validar_pow(block.__dict__, block_hash):
+                print("❌ Bloque con PoW inválido")
+                return False
+
+            with self.blockchain.lock:
+                # Verificar hash anterior
+                if block_data['hash_anterior'] != self.blockchain.last_block_hash:
+                    print("❌ Hash anterior no coincide")
+                    return False
+                
+                # Agregar bloque (avanza la punta: el minado local reinicia)
+                self.blockchain.nuevo_bloque(block, block_hash)
+            # nuevo_bloque ya quitó de la mempool las transacciones del bloque
             print(f"✅ Bloque {block_data['indice']} agregado exitosamente")
             
-            # Verificar si hay transacciones pendientes que ya están en este bloque
-            self._cleanup_pending_transactions(block_data['transacciones'])
-            
             return True
             
         except Exception as e:
             print(f"❌ Error validando bloque: {e}")
             return False
     
-    def _cleanup_pending_transactions(self, block_transactions):
-        """Limpiar transacciones pendientes que ya están en bloques confirmados"""
-        pending_txs = self.blockchain.transacciones_pendientes.copy()
-        
-        for pending_tx in pending_txs:
-            for block_tx in block_transactions:
-                # Comparar transacciones por contenido similar
-                if self._transactions_match(pending_tx, block_tx):
-                    try:
-                        self.blockchain.transacciones_pendientes.remove(pending_tx)
-                        print(f"🧹 Transacción limpiada de pendientes")
-                    except ValueError:
-                        pass
-    
-    def _transactions_match(self, tx1, tx2):
-        """Verificar si dos transacciones son iguales"""
-        keys = ['envia', 'recibe', 'monto']
-        for key in keys:
-            if tx1.get(key) != tx2.get(key):
-                return False
-        return True
-    
     def _process_received_transaction(self, transaction_data, sender):
-        """Procesar transacción recibida de otro nodo"""
+        """Procesar transacción recibida de otro nodo; False si no se pudo procesar"""
+        tx_id = None
         try:
-            # Verificar si ya tenemos esta transacción
-            for pending_tx in self.blockchain.transacciones_pendientes:
-                if self._transactions_match(pending_tx, transaction_data):
-                    print("⏭️  Transacción ya existe, ignorando")
-                    return
+            tx_id, known = self._register_received(INV_TX, transaction_data, sender)
+            if known:
+                print("⏭️  Transacción ya recibida o expulsada, ignorando")
+                return True
+
+            # Verificar si ya tenemos esta transacción (mismo id de contenido)
+            if tx_id in self.blockchain.mempool:
+                print("⏭️  Transacción ya existe, ignorando")
+                return True
             
-            # Agregar transacción pendiente
-            self.blockchain.add_transaction(
-                transaction_data['envia'],
-                transaction_data['recibe'],
-                transaction_data['monto'],
-                transaction_data.get('fee', 0.001)
-            )
+            # Agregar transacción pendiente con su timestamp original
+            self._add_received_transaction(transaction_data)
             print(f"✅ Transacción recibida agregada a pendientes")
+            # Se reenvía en el lote de salida, no con un inv propio
+            self._relay_transactions([transaction_data])
+            return True
             
         except Exception as e:
             print(f"❌ Error procesando transacción recibida: {e}")
+            # Fuera del inventario, para que un reenvío vuelva a intentarlo
+            if tx_id:
+                self.inventory.discard(tx_id)
+            return False
     
-    def request_full_chain(self, target_node):
-        """Solicitar cadena completa a un nodo específico"""
+    def _process_received_transactions_batch(self, batch_data, sender):
+        """Procesar un lote de transacciones recibido de otro nodo"""
         try:
-            message = {
-                'type': 'chain_request',
-                'timestamp': time.time(),
-                'node_id': getattr(self.blockchain, 'node_id', 'unknown')
-            }
-            
-            # Intentar tanto HTTP como HTTPS
-            protocols = ['https', 'http']
-            success = False
-            
-            for protocol in protocols:
-                try:
-                    url = f"{protocol}://{target_node}/network/receive"
-                    response = requests.post(url, json=message, timeout=10)
-                    
-                    if response.status_code == 200:
-                        print(f"✅ Solicitud de cadena enviada a {target_node} ({protocol})")
-                        success = True
-                        break
-                except:
+            transactions = batch_data.get('transactions', [])
+            added = []
+            for transaction_data in transactions:
+                tx_id, received = self._register_received(INV_TX, transaction_data, sender)
+                if received or tx_id in self.blockchain.mempool:
                     continue
-            
-            if not success:
-                print(f"❌ Error solicitando cadena a {target_node}")
-                
+                try:
+                    self._add_received_transaction(transaction_data)
+                    added.append(transaction_data)
+                except Exception as e:
+                    print(f"❌ Transacción del lote rechazada: {e}")
+                    self.inventory.discard(tx_id)
+
+            print(f"✅ Lote de {sender}: {len(added)} de {len(transactions)} transacciones agregadas a pendientes")
+            if added:
+                self._relay_transactions(added)
+            return True
+
         except Exception as e:
-            print(f"❌ No se pudo solicitar cadena a {target_node}: {e}")
-    
+            print(f"❌ Error procesando lote de transacciones: {e}")
+            return False
+
+    def _add_received_transaction(self, transaction_data):
+        """Añadir a la mempool una transacción de otro nodo, conservando su timestamp"""
+        self.blockchain.add_transaction(
+            transaction_data['envia'],
+            transaction_data['recibe'],
+            transaction_data['monto'],
+            transaction_data.get('fee', 0.001),
+            transaction_data.get('timestamp')
+        )
+
     def _handle_chain_request(self, sender):
         """Manejar solicitud de cadena de otro nodo"""
         try:
             chain_data = {
-                'chain': self.blockchain.chain,
+                'chain': list(self.blockchain.chain),
                 'length': len(self.blockchain.chain),
                 'total_supply': self.blockchain.get_total_supply()
             }
@@ -351,24 +510,11 @@ class NetworkManager:
                 'node_id': getattr(self.blockchain, 'node_id', 'unknown')
             }
             
-            # Intentar tanto HTTP como HTTPS
-            protocols = ['https', 'http']
-            success = False
-            
-            for protocol in protocols:
-                try:
-                    url = f"{protocol}://{sender}/network/receive"
-                    response = requests.post(url, json=message, timeout=10)
-                    
-                    if response.status_code == 200:
-                        print(f"✅ Cadena enviada a {sender} ({protocol})")
-                        success = True
-                        break
-                except:
-                    continue
-            
-            if not success:
-                print(f"❌ Error enviando cadena a {sender}")
+            response = self.blockchain.peer_client.post(sender, '/network/receive', json=message)
+            if response.status_code == 200:
+                print(f"✅ Cadena enviada a {sender}")
+            else:
+                print(f"❌ Error enviando cadena a {sender}: HTTP {response.status_code}")
                 
         except Exception as e:
             print(f"❌ Error manejando solicitud de cadena: {e}")
@@ -381,99 +527,18 @@ class NetworkManager:
             
             print(f"📥 Cadena recibida de {sender}: {received_length} bloques")
             
-            # Validar cadena recibida
-            if self.blockchain.valid_chain(received_chain):
-                current_length = len(self.blockchain.chain)
-                
-                # Adoptar cadena más larga
-                if received_length > current_length:
-                    print(f"🔄 Adoptando cadena más larga de {sender}")
-                    self.blockchain.chain = received_chain
-                    self.blockchain.save_blockchain()
-                    
-                    # Limpiar transacciones pendientes que ya están en la nueva cadena
-                    self._cleanup_pending_from_chain(received_chain)
-                    
-                    print(f"✅ Cadena actualizada a {received_length} bloques")
-                else:
-                    print(f"⏭️  Nuestra cadena es más larga o igual, manteniendo")
+            # Adoptar cadena más larga: se valida y aplica solo desde la bifurcación
+            applied = self.blockchain.replace_chain(received_chain)
+            if applied:
+                # apply_blocks ya quitó de la mempool lo confirmado en los bloques nuevos
+                print(f"🔄 Adoptando cadena más larga de {sender} ({len(applied)} bloques nuevos)")
+                print(f"✅ Cadena actualizada a {received_length} bloques")
             else:
-                print(f"❌ Cadena recibida de {sender} es inválida")
+                print(f"⏭️  Cadena de {sender} inválida o no más larga, manteniendo")
                 
         except Exception as e:
             print(f"❌ Error manejando respuesta de cadena: {e}")
     
-    def _cleanup_pending_from_chain(self, new_chain):
-        """Limpiar transacciones pendientes basado en nueva cadena"""
-        all_confirmed_txs = []
-        for block in new_chain:
-            all_confirmed_txs.extend(block.get('transacciones', []))
-        
-        pending_txs = self.blockchain.transacciones_pendientes.copy()
-        
-        for pending_tx in pending_txs:
-            for confirmed_tx in all_confirmed_txs:
-                if self._transactions_match(pending_tx, confirmed_tx):
-                    try:
-                        self.blockchain.transacciones_pendientes.remove(pending_tx)
-                        print(f"🧹 Transacción confirmada limpiada de pendientes")
-                    except ValueError:
-                        pass
-    
     def sync_blockchain(self):
-        """Sincronizar blockchain con todos los nodos - VERSIÓN MEJORADA"""
-        print("🔄 Iniciando sincronización de blockchain...")
-        
-        longest_chain = None
-        max_length = len(self.blockchain.chain)
-        
-        for node in list(self.blockchain.nodes):
-            try:
-                print(f"🔍 Consultando nodo: {node}")
-                
-                # Intentar tanto HTTP como HTTPS
-                protocols = ['https', 'http']
-                success = False
-                
-                for protocol in protocols:
-                    try:
-                        url = f"{protocol}://{node}/chain"
-                        response = requests.get(url, timeout=15)
-                        
-                        if response.status_code == 200:
-                            node_chain = response.json()
-                            node_length = node_chain['largo']
-                            chain_data = node_chain['chain']
-                            
-                            print(f"📡 Nodo {node} ({protocol}): {node_length} bloques")
-                            
-                            if node_length > max_length and self.blockchain.valid_chain(chain_data):
-                                max_length = node_length
-                                longest_chain = chain_data
-                                print(f"🎯 Cadena más larga encontrada en {node}")
-                            
-                            success = True
-                            break
-                    except Exception as e:
-                        print(f"   ❌ {protocol}://{node} falló: {e}")
-                        continue
-                
-                if not success:
-                    print(f"❌ No se pudo conectar a {node} con ningún protocolo")
-                        
-            except Exception as e:
-                print(f"❌ Error sincronizando con {node}: {e}")
-        
-        if longest_chain:
-            print(f"✅ Sincronizando con cadena de {max_length} bloques")
-            self.blockchain.chain = longest_chain
-            self.blockchain.save_blockchain()
-            return True
-        else:
-            print("✅ Nuestra cadena es la más actualizada")
-            return False
-    
-    def _calculate_block_hash(self, block):
-        """Calcular hash de un bloque (mismo método que en core.py)"""
-        block_string = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        """Sincronizar blockchain con los peers (headers-first, ver ChainSync)"""
+        return self.blockchain.update_blockchain()
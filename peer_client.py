@@ -0,0 +1,194 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from threading import Lock, BoundedSemaphore
+from urllib.parse import urlparse
+
+
+class PeerUnavailable(Exception):
+    """El peer no respondió en ningún endpoint y está en espera de reintento"""
+
+
+def _counting_pool(pool_class, on_new_connection):
+    """Subclase del pool de urllib3 que avisa cada vez que abre una conexión"""
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            on_new_connection()
+            return super()._new_conn()
+    return CountingPool
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter con pools keep-alive por host que cuenta las conexiones nuevas"""
+
+    def __init__(self, on_new_connection, **kwargs):
+        self.on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _counting_pool(pool_class, self.on_new_connection)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class PeerClient:
+    """Cliente HTTP para hablar con los peers a través de un registro de endpoints.
+
+    Para cada nodo se recuerda qué esquema y puerto funcionaron (por ejemplo
+    http://host:5000) y las siguientes llamadas van directas a ese endpoint,
+    sin el intento HTTPS fallido previo. Solo se vuelve a sondear cuando el
+    endpoint recordado deja de conectar. Si ningún candidato responde, el
+    nodo queda en espera (`retry_interval`, que se dobla en cada sondeo
+    fallido hasta `max_retry_interval`) y mientras tanto las llamadas fallan
+    al instante con PeerUnavailable en lugar de volver a marcar.
+
+    Las peticiones comparten una requests.Session con un pool keep-alive por
+    host (`pool_hosts` hosts, hasta `pool_size` conexiones cada uno), así que
+    un broadcast reutiliza la conexión TCP/TLS ya abierta con cada peer. Como
+    mucho `max_concurrency` peticiones van en vuelo a la vez, y las que no
+    indican timeout usan (`connect_timeout`, `read_timeout`).
+    """
+
+    def __init__(self, default_port=5000, retry_interval=30, max_retry_interval=300,
+                 pool_hosts=64, pool_size=4, max_concurrency=32,
+                 connect_timeout=3, read_timeout=10):
+        self.default_port = default_port
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.timeout = (connect_timeout, read_timeout)
+        self._endpoints = {}  # nodo -> estado del endpoint
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(max_concurrency)
+        self.probes = 0
+        self.dials = 0
+        self.connections_opened = 0
+        self.in_flight = 0
+
+        self.session = requests.Session()
+        adapter = _PooledAdapter(self._connection_opened,
+                                 pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _connection_opened(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def candidates(self, node):
+        """URLs base a probar para un nodo, en orden de preferencia"""
+        parsed = urlparse(node if '://' in node else f"//{node}")
+        if parsed.scheme:
+            # El nodo ya indica esquema: no hay nada que adivinar
+            return [f"{parsed.scheme}://{parsed.netloc}"]
+        if parsed.port:
+            return [f"https://{parsed.netloc}", f"http://{parsed.netloc}"]
+        return [
+            f"https://{parsed.netloc}",
+            f"http://{parsed.netloc}",
+            f"http://{parsed.netloc}:{self.default_port}"
+        ]
+
+    def _state(self, node):
+        with self._lock:
+            return self._endpoints.setdefault(node, {
+                'base_url': None,
+                'failures': 0,
+                'retry_at': 0,
+                'last_ok': None
+            })
+
+    def endpoint(self, node):
+        """URL base recordada para un nodo, o None si aún no se conoce"""
+        with self._lock:
+            state = self._endpoints.get(node)
+            return state['base_url'] if state else None
+
+    def forget(self, node):
+        with self._lock:
+            self._endpoints.pop(node, None)
+
+    def _send(self, method, base_url, path, kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._slots:
+            with self._lock:
+                self.dials += 1
+                self.in_flight += 1
+            try:
+                return self.session.request(method, f"{base_url}{path}", **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def request(self, method, node, path, **kwargs):
+        """Petición a un peer por su endpoint recordado; sondea si hace falta"""
+        state = self._state(node)
+        base_url = state['base_url']
+
+        if base_url:
+            try:
+                response = self._send(method, base_url, path, kwargs)
+                state['last_ok'] = time.time()
+                return response
+            except requests.exceptions.ConnectionError:
+                # El endpoint recordado dejó de funcionar: volver a sondear
+                print(f"⚠️  {base_url} no responde, sondeando de nuevo {node}")
+                state['base_url'] = None
+        elif time.time() < state['retry_at']:
+            raise PeerUnavailable(f"{node} no disponible hasta dentro de "
+                                  f"{state['retry_at'] - time.time():.0f}s")
+
+        return self._probe(method, node, path, kwargs, state)
+
+    def _probe(self, method, node, path, kwargs, state):
+        """Probar los candidatos en orden y recordar el primero que conecte"""
+        self.probes += 1
+        last_error = None
+        for base_url in self.candidates(node):
+            try:
+                response = self._send(method, base_url, path, kwargs)
+            except requests.exceptions.ConnectionError as e:
+                last_error = e
+                continue
+            state.update(base_url=base_url, failures=0, retry_at=0, last_ok=time.time())
+            return response
+
+        state['failures'] += 1
+        backoff = min(self.retry_interval * 2 ** (state['failures'] - 1), self.max_retry_interval)
+        state['retry_at'] = time.time() + backoff
+        raise PeerUnavailable(f"No se pudo conectar a {node}: {last_error}")
+
+    def get(self, node, path, **kwargs):
+        return self.request('GET', node, path, **kwargs)
+
+    def post(self, node, path, **kwargs):
+        return self.request('POST', node, path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def stats(self):
+        """Endpoints conocidos y contadores de sondeos y conexiones"""
+        now = time.time()
+        with self._lock:
+            endpoints = {
+                node: {
+                    'endpoint': state['base_url'],
+                    'failures': state['failures'],
+                    'retry_in': max(state['retry_at'] - now, 0)
+                }
+                for node, state in self._endpoints.items()
+            }
+            return {
+                'probes': self.probes,
+                'dials': self.dials,
+                'connections_opened': self.connections_opened,
+                'connections_reused': max(self.dials - self.connections_opened, 0),
+                'in_flight': self.in_flight,
+                'max_concurrency': self.max_concurrency,
+                'peers': endpoints
+            }
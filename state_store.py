@@ -0,0 +1,264 @@
+import os
+import json
+import time
+from collections import deque, OrderedDict
+from threading import Thread, Event, RLock
+
+# Entrada del journal que da de baja el elemento con esa clave
+TOMBSTONE = '__removed__'
+
+
+class JournaledList:
+    """Lista persistida como snapshot JSON + journal de altas append-only.
+
+    Las altas (una transacción pendiente, un peer nuevo) se acumulan en
+    memoria y en cada flush() se escriben juntas al journal con un único
+    fsync. Los cambios que no son altas (limpiezas, reinicios) se marcan con
+    mark_snapshot(): el siguiente flush() reescribe el snapshot de forma
+    atómica a partir de `source()` y empieza un journal nuevo.
+
+    Con una función `key`, las bajas sueltas (una transacción expulsada o
+    caducada) también van al journal, como tombstones con discard(), y al
+    cargar quitan el elemento de esa clave. El journal se compacta en un
+    snapshot cuando tiene al menos `compact_every` entradas y ocupa ya tanto
+    como el snapshot: reescribirlo cuesta como mucho lo mismo que lo
+    escrito en el journal desde el anterior.
+
+    Snapshot y journal llevan un número de generación: si el proceso cae
+    entre escribir el snapshot y borrar el journal, el journal viejo se
+    ignora al cargar. Una última línea a medio escribir se descarta y se
+    trunca.
+    """
+
+    def __init__(self, path, source=None, lock=None, compact_every=1000, key=None):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.source = source
+        self.lock = lock or RLock()
+        self.compact_every = compact_every
+        self.key = key
+        self.generation = 0
+        self.journal_entries = 0
+        self.journal_bytes = 0
+        self.snapshot_bytes = 0
+        self.bytes_written = 0
+        self._buffer = []
+        self._snapshot_pending = False
+        # Lo asigna el PersistenceScheduler para enterarse de los cambios
+        self.on_dirty = None
+
+    def exists(self):
+        return os.path.exists(self.path) or os.path.exists(self.journal_path)
+
+    @property
+    def dirty(self):
+        return bool(self._buffer) or self._snapshot_pending
+
+    def load(self):
+        """Leer el snapshot y reaplicar el journal de su misma generación"""
+        items = []
+        self.generation = 0
+        self.snapshot_bytes = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.generation = data['generation']
+            items = data['items']
+            self.snapshot_bytes = os.path.getsize(self.path)
+
+        self.journal_entries = 0
+        self.journal_bytes = 0
+        entries = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+            # Solo cuentan las líneas completas (terminadas en salto de línea)
+            lines = data[:data.rfind(b'\n') + 1].splitlines(keepends=True)
+            try:
+                journal_generation = json.loads(lines[0])['generation']
+            except (IndexError, ValueError, KeyError):
+                journal_generation = None
+
+            if journal_generation == self.generation:
+                valid = len(lines[0])
+                for line in lines[1:]:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break
+                    self.journal_entries += 1
+                    valid += len(line)
+                if valid < len(data):
+                    # Escritura cortada: se trunca para que las altas siguientes
+                    # no continúen la línea rota y se pierdan al cargar
+                    print(f"⚠️  Cola incompleta en {self.journal_path}, truncando")
+                    with open(self.journal_path, 'r+b') as f:
+                        f.truncate(valid)
+                        f.flush()
+                        os.fsync(f.fileno())
+                self.journal_bytes = valid
+            else:
+                # Journal ya incluido en un snapshot posterior (o ilegible)
+                os.remove(self.journal_path)
+
+        if self.key is None:
+            return items + entries
+        live = OrderedDict((self.key(item), item) for item in items)
+        for entry in entries:
+            if isinstance(entry, dict) and TOMBSTONE in entry:
+                live.pop(entry[TOMBSTONE], None)
+            else:
+                live[self.key(entry)] = entry
+        return list(live.values())
+
+    def append(self, item):
+        """Registrar un alta; se escribe en el próximo flush()"""
+        with self.lock:
+            self._buffer.append(item)
+        if self.on_dirty:
+            self.on_dirty()
+
+    def discard(self, key):
+        """Registrar la baja del elemento con esa clave; se escribe en el próximo flush()"""
+        self.append({TOMBSTONE: key})
+
+    def mark_snapshot(self):
+        """Pedir que el próximo flush() reescriba el snapshot completo"""
+        with self.lock:
+            self._snapshot_pending = True
+        if self.on_dirty:
+            self.on_dirty()
+
+    def flush(self):
+        """Escribir lo pendiente; devuelve los bytes escritos"""
+        with self.lock:
+            if not self.dirty:
+                return 0
+
+            compact = (self.journal_entries + len(self._buffer) >= self.compact_every and
+                       self.journal_bytes >= self.snapshot_bytes)
+            if self._snapshot_pending or compact:
+                written = self.write_snapshot(self.source())
+            else:
+                written = self._write_journal(self._buffer)
+
+            self._buffer = []
+            self._snapshot_pending = False
+            return written
+
+    def _write_journal(self, items):
+        data = ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in items)
+        if not os.path.exists(self.journal_path):
+            data = json.dumps({'generation': self.generation}) + '\n' + data
+        with open(self.journal_path, 'a') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_entries += len(items)
+        self.journal_bytes += len(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def write_snapshot(self, items):
+        """Guardar la lista completa ya y empezar un journal nuevo"""
+        data = json.dumps({
+            'generation': self.generation + 1,
+            'items': list(items)
+        }, separators=(',', ':'))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.generation += 1
+
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_entries = 0
+        self.journal_bytes = 0
+        self.snapshot_bytes = len(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+
+class PersistenceScheduler:
+    """Agrupa las escrituras de estado en flushes periódicos (group commit).
+
+    Los almacenes se marcan como sucios sin tocar disco; un hilo en segundo
+    plano los vuelca como mucho cada `interval_ms` milisegundos. flush() fuerza
+    el volcado inmediato (bloques nuevos) y stop() hace el último al apagar.
+    """
+
+    def __init__(self, stores, interval_ms=200):
+        self.stores = stores
+        for store in stores:
+            store.on_dirty = self.notify
+        self.interval = interval_ms / 1000
+        self.running = False
+        self._wake = Event()
+        self._thread = None
+        self._last_flush = 0
+        self.flush_count = 0
+        self.bytes_written = 0
+        self._recent_flushes = deque(maxlen=1000)
+
+    def start(self):
+        self.running = True
+        self._thread = Thread(target=self._flush_worker, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el hilo y volcar todo lo pendiente"""
+        self.running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def notify(self):
+        """Avisar de que hay estado sucio pendiente de volcar"""
+        self._wake.set()
+
+    def _flush_worker(self):
+        """Trabajador que vuelca el estado sucio respetando el intervalo mínimo"""
+        while self.running:
+            self._wake.wait()
+            self._wake.clear()
+            if not self.running:
+                break
+
+            # Agrupar todo lo que llegue hasta cumplir el intervalo
+            remaining = self._last_flush + self.interval - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Error volcando estado a disco: {e}")
+
+    def flush(self):
+        """Volcar ya todos los almacenes sucios"""
+        written = 0
+        for store in self.stores:
+            if store.dirty:
+                written += store.flush()
+
+        self._last_flush = time.time()
+        if written:
+            self.flush_count += 1
+            self.bytes_written += written
+            self._recent_flushes.append(self._last_flush)
+        return written
+
+    def stats(self):
+        """Métricas de persistencia: flushes por segundo y bytes escritos"""
+        now = time.time()
+        last_minute = sum(1 for t in self._recent_flushes if now - t <= 60)
+        return {
+            'flush_interval_ms': self.interval * 1000,
+            'flushes': self.flush_count,
+            'flushes_per_second': last_minute / 60,
+            'bytes_written': self.bytes_written,
+            'dirty': [store.path for store in self.stores if store.dirty]
+        }
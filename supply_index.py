@@ -0,0 +1,112 @@
+import os
+import struct
+from threading import RLock
+
+# Por altura: supply y fees acumulados tras ese bloque, y el hash del bloque
+SUPPLY_RECORD = struct.Struct('<dd32s')
+# Bloques que se leen y acumulan de una vez al ponerse al día
+LOAD_BATCH = 500
+
+
+def block_supply_totals(block, supply, fees):
+    """Acumular las recompensas y fees de las coinbase de un bloque.
+
+    Suma transacción a transacción, en el mismo orden que el recorrido
+    completo de la cadena, para obtener exactamente los mismos floats.
+    """
+    for tx in block.get('transacciones', []):
+        if tx.get('tipo') == 'coinbase':
+            supply += tx.get('recompensa', 0)
+            fees += tx.get('fees', 0)
+    return supply, fees
+
+
+class SupplyIndex:
+    """Supply y fees acumulados por altura en un fichero de registros fijos.
+
+    El registro de la altura H guarda el supply total y los fees totales
+    hasta ese bloque incluido, así que tanto el supply actual como el de
+    cualquier altura pasada se leen en O(1). Se mantiene al añadir bloques y
+    se trunca en los reorgs. Cada registro lleva el hash de su bloque: al
+    abrir se descartan los registros que ya no son de la cadena (un corte a
+    mitad de un reorg) y se recalcula lo que falte.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._last = (0.0, 0.0)
+        self._lock = RLock()
+
+    def __len__(self):
+        return self.count
+
+    def load(self, chain, block_hash):
+        """Ajustar el fichero a la cadena: descartar lo ajeno y calcular lo que falte"""
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            self.count = min(size // SUPPLY_RECORD.size, len(chain))
+            # Por el encadenado de hashes, si la última coincide coinciden todas
+            while self.count and self._read_record(self.count - 1)[2].hex() != block_hash(self.count - 1):
+                self.count -= 1
+            with open(self.path, 'ab') as f:
+                f.truncate(self.count * SUPPLY_RECORD.size)
+            self._last = self._read(self.count - 1) if self.count else (0.0, 0.0)
+
+            missing = len(chain) - self.count
+            if missing > 0:
+                print(f"🔄 Calculando supply acumulado de {missing} bloques")
+            for start in range(self.count, len(chain), LOAD_BATCH):
+                stop = min(start + LOAD_BATCH, len(chain))
+                self.append_many(chain[start:stop], [block_hash(h) for h in range(start, stop)])
+
+    def append_many(self, blocks, hashes):
+        """Acumular los bloques siguientes a la punta con un único fsync"""
+        with self._lock:
+            supply, fees = self._last
+            data = bytearray()
+            for block, block_hash in zip(blocks, hashes):
+                supply, fees = block_supply_totals(block, supply, fees)
+                data += SUPPLY_RECORD.pack(supply, fees, bytes.fromhex(block_hash))
+
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.count += len(data) // SUPPLY_RECORD.size
+            self._last = (supply, fees)
+
+    def append(self, block, block_hash):
+        self.append_many([block], [block_hash])
+
+    def truncate(self, height):
+        """Quitar los registros desde `height` (reorganizaciones)"""
+        with self._lock:
+            if height >= self.count:
+                return
+            with open(self.path, 'r+b') as f:
+                f.truncate(height * SUPPLY_RECORD.size)
+            self.count = height
+            self._last = self._read(height - 1) if height else (0.0, 0.0)
+
+    def at(self, height):
+        """(supply, fees) acumulados hasta la altura `height` incluida"""
+        with self._lock:
+            if not 0 <= height < self.count:
+                raise IndexError(f"Altura fuera de rango: {height}")
+            if height == self.count - 1:
+                return self._last
+            return self._read(height)
+
+    def _read_record(self, height):
+        with open(self.path, 'rb') as f:
+            f.seek(height * SUPPLY_RECORD.size)
+            return SUPPLY_RECORD.unpack(f.read(SUPPLY_RECORD.size))
+
+    def _read(self, height):
+        supply, fees, _ = self._read_record(height)
+        return supply, fees
+
+    def total(self):
+        """(supply, fees) acumulados en la punta"""
+        return self._last
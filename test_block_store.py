@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+from block_store import BlockStore
+
+
+def hash_block(block):
+    return hashlib.sha256(json.dumps(block, sort_keys=True).encode()).hexdigest()
+
+
+def make_block(height, tag):
+    return {'indice': height, 'hash_anterior': '0' * 64,
+            'transacciones': [{'tag': tag}], 'tiempo': float(height), 'nonce': height}
+
+
+def test_reorg_during_read_does_not_cache_orphaned_block(tmp_path):
+    store = BlockStore(str(tmp_path / 'blocks'), hash_block)
+    store.append_many([make_block(0, 'a'), make_block(1, 'a')])
+    replacement = make_block(1, 'b')
+
+    decode = store._decode
+
+    def decode_during_reorg(payload):
+        # Reorg entre la lectura del registro y su inserción en la caché
+        block = decode(payload)
+        store.truncate(1)
+        store.append(replacement)
+        return block
+
+    store._decode = decode_during_reorg
+    orphaned = store.read(1)
+    store._decode = decode
+
+    assert orphaned['transacciones'] == [{'tag': 'a'}]
+    assert store.read(1) == replacement
+    assert store.block_hash(1) == hash_block(replacement)
+    store.close()
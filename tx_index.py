@@ -0,0 +1,111 @@
+import sqlite3
+from threading import RLock
+
+from mempool import transaction_id
+
+# Bloques que se indexan por transacción SQLite al ponerse al día
+INDEX_BATCH = 500
+
+
+class TxIndex:
+    """Índice persistente id de transacción -> (altura, posición en el bloque).
+
+    Vive en una base SQLite: la tabla `txs` tiene como clave el id de la
+    transacción y cada consulta es una búsqueda en su B-tree en disco, así
+    que ni la memoria ni el arranque crecen con el historial. La tabla
+    `blocks` guarda el hash de cada bloque indexado: al abrir se descartan
+    los bloques cuyo hash ya no es el de la cadena (un corte a mitad de un
+    reorg) y se indexa lo que falte. Cada lote de bloques se escribe en una
+    transacción, así que un bloque nunca queda indexado a medias.
+
+    Si una misma transacción aparece en varios bloques, el índice apunta a
+    la primera aparición.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS blocks '
+                             '(height INTEGER PRIMARY KEY, hash BLOB NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS txs '
+                             '(id BLOB PRIMARY KEY, height INTEGER NOT NULL, position INTEGER NOT NULL) '
+                             'WITHOUT ROWID')
+            self._db.execute('CREATE INDEX IF NOT EXISTS txs_height ON txs (height)')
+        self.count = self._indexed_blocks()  # bloques indexados
+
+    def __len__(self):
+        return self.count
+
+    def _indexed_blocks(self):
+        row = self._db.execute('SELECT MAX(height) FROM blocks').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _stored_hash(self, height):
+        row = self._db.execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+        return None if row is None else bytes(row[0]).hex()
+
+    def load(self, chain, block_hash):
+        """Descartar lo ajeno a la cadena e indexar lo que falte"""
+        with self._lock:
+            self.count = self._indexed_blocks()
+            # Bajar desde la punta indexada hasta el último bloque que sigue en la cadena
+            height = min(self.count, len(chain))
+            while height and self._stored_hash(height - 1) != block_hash(height - 1):
+                height -= 1
+            self.truncate(height)
+
+            missing = len(chain) - self.count
+            if missing > 0:
+                print(f"🔄 Indexando transacciones de {missing} bloques")
+            for start in range(self.count, len(chain), INDEX_BATCH):
+                stop = min(start + INDEX_BATCH, len(chain))
+                self.append_many(chain[start:stop], [block_hash(h) for h in range(start, stop)])
+
+    def append_many(self, blocks, hashes):
+        """Indexar los bloques siguientes a la punta en una sola transacción"""
+        with self._lock:
+            height = self.count
+            block_rows, tx_rows = [], []
+            for block, block_hash in zip(blocks, hashes):
+                block_rows.append((height, bytes.fromhex(block_hash)))
+                for position, tx in enumerate(block.get('transacciones', [])):
+                    tx_rows.append((bytes.fromhex(transaction_id(tx)), height, position))
+                height += 1
+
+            with self._db:
+                self._db.executemany('INSERT INTO blocks (height, hash) VALUES (?, ?)', block_rows)
+                # Si ya estaba indexada, se queda la primera aparición
+                self._db.executemany('INSERT OR IGNORE INTO txs (id, height, position) VALUES (?, ?, ?)',
+                                     tx_rows)
+            self.count = height
+
+    def append(self, block, block_hash):
+        self.append_many([block], [block_hash])
+
+    def truncate(self, height):
+        """Quitar las transacciones de los bloques desde `height` (reorganizaciones)"""
+        with self._lock:
+            if height >= self.count:
+                return
+            with self._db:
+                self._db.execute('DELETE FROM txs WHERE height >= ?', (height,))
+                self._db.execute('DELETE FROM blocks WHERE height >= ?', (height,))
+            self.count = height
+
+    def lookup(self, tx_id):
+        """(altura, posición) de una transacción confirmada, o None"""
+        try:
+            digest = bytes.fromhex(tx_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            row = self._db.execute('SELECT height, position FROM txs WHERE id = ?', (digest,)).fetchone()
+        return None if row is None else tuple(row)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
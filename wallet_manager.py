@@ -131,12 +131,5 @@ class WalletManager:
             return False
 
     def get_wallet_balance(self, address, blockchain):
-        """Calcular balance de una wallet revisando la blockchain"""
-        balance = 0
-        for block in blockchain.chain:
-            for tx in block.get('transacciones', []):
-                if tx.get('destino') == address or tx.get('recibe') == address:
-                    balance += tx.get('monto', 0) + tx.get('recompensa', 0)
-                if tx.get('envia') == address:
-                    balance -= tx.get('monto', 0)
-        return balance
+        """Balance de una wallet según el índice de balances de la blockchain"""
+        return blockchain.balances.get(address)